@@ -0,0 +1,73 @@
+import numpy as np
+import stats_2D as stat2D
+
+"""
+Toy-free -2ln(Q) distributions.
+-2ln(Q) = 2*s_tot - 2*X with X = sum_i N_i*log(1+s_i/b_i) a weighted sum of independent Poisson
+counts. Rounding the weights onto a fine lattice w_i ~ k_i*h makes X/h a compound Poisson variable
+whose characteristic function is exp(FFT(Lambda) - Lambda_tot), where Lambda_k is the summed
+expectation of all bins with lattice weight k. One FFT pair therefore gives the full distribution.
+Signal-only and empty bins are treated as in stats_2D.
+"""
+
+#-------------------------------------------------------------------------------------------
+def CompoundPoissonPmf (k, lam, N_grid) :
+    # pmf of sum_i k_i*N_i with N_i ~ Poisson(lam_i) on 0..N_grid-1
+    Lambda = np.bincount(k, weights=lam, minlength=N_grid)[:N_grid]
+    pmf = np.fft.irfft(np.exp(np.fft.rfft(Lambda) - Lambda.sum()), n=N_grid)
+    pmf[pmf < 0] = 0   # round-off far in the tails
+    return pmf/pmf.sum()
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioAnalytic (background, signal, N_grid=2**18, N_sigma=15) :
+
+    template = stat2D.LogLikRatioTemplate(background, signal)
+    b = template['b']
+    s = template['s']
+    weights = template['weights']
+
+    # the lattice has to hold X for both hypotheses, s+b gives the larger values
+    mean = np.dot(s+b, weights)
+    sigma = np.sqrt(np.dot(s+b, weights**2))
+    upper = mean + N_sigma*sigma + 4*(weights.max() if len(weights) else 0.)
+    if upper <= 0 :
+        upper = 1.
+    h = upper/(N_grid-1)
+
+    k = np.rint(weights/h).astype(int)
+    pdf_b = CompoundPoissonPmf(k, b, N_grid)
+    pdf_sPlusb = CompoundPoissonPmf(k, s+b, N_grid)
+
+    # ascending -2ln(Q)
+    llr = 2*template['s_tot'] - 2*h*np.arange(N_grid)
+
+    return {'llr': llr[::-1],
+            'pdf_b': pdf_b[::-1],
+            'pdf_sPlusb': pdf_sPlusb[::-1],
+            'step': 2*h}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def AnalyticCL (dist, obs) :
+    # [1-CL_b, CL_s+b] = [P_b(-2lnQ < obs), P_s+b(-2lnQ >= obs)] as in LogLikRatioPlots
+    pos = np.searchsorted(dist['llr'], obs, side='left')
+    cumulative_b = np.concatenate([[0.], np.cumsum(dist['pdf_b'])])
+    cumulative_sPlusb = np.concatenate([[0.], np.cumsum(dist['pdf_sPlusb'])])
+
+    return [cumulative_b[pos], 1. - cumulative_sPlusb[pos]]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def AnalyticQuantiles (dist, pdf='pdf_b') :
+    # same format as stats.GetQuantiles
+    cumulative = np.cumsum(dist[pdf])
+    probs = [0.5, 0.16, 1.-0.16, 0.023, 1.-0.023]
+    pos = np.minimum(np.searchsorted(cumulative, probs, side='left'), len(cumulative)-1)
+    Median, OneSigmaLeft, OneSigmaRight, TwoSigmaLeft, TwoSigmaRight = dist['llr'][pos]
+
+    return [Median,[OneSigmaLeft,OneSigmaRight],[TwoSigmaLeft,TwoSigmaRight]]
+#-------------------------------------------------------------------------------------------
@@ -0,0 +1,231 @@
+import numpy as np
+import argparse
+import json
+import time
+import platform
+import resource
+import multiprocessing
+import stats as stat
+import stats_2D as stat2D
+
+"""
+Benchmark and scaling suite for the hot paths: toy generation (stats.LogLikRatio,
+stats_2D.LogLikRatio_TwoD), observed -2lnQ for many pseudo-datasets (LogLikRatioObserved,
+LogLikRatiosObserved, both called once per chunk of pseudo-datasets), quantiles (GetQuantiles)
+and histogram fills. All templates are synthetic and generated locally. Every case runs in a
+fresh worker process, so the peak memory (ru_maxrss) belongs to that case only.
+
+    python benchmark.py --grid quick --save bench/baseline.json
+    python benchmark.py --grid quick --compare bench/baseline.json --threshold 0.25
+
+With --compare, cases slower than the baseline by more than the threshold are flagged and the
+exit code is 1. The full grid (1D up to 10^3 bins, 2D up to 100x100 with 0-90% empty bins,
+10^3-10^7 toys) takes a long time.
+"""
+
+GRIDS = {'quick': {'bins_1D': [27, 100, 1000],
+                   'shapes_2D': [(7, 6), (30, 30), (100, 100)],
+                   'empty_fractions': [0., 0.5],
+                   'N_experiments': [1000, 10000]},
+         'full': {'bins_1D': [27, 100, 300, 1000],
+                  'shapes_2D': [(7, 6), (30, 30), (60, 60), (100, 100)],
+                  'empty_fractions': [0., 0.5, 0.9],
+                  'N_experiments': [1000, 10000, 100000, 1000000, 10000000]}}
+
+# toys and pseudo-datasets are processed in chunks of about this many bins
+CHUNK_CELLS = 2**22
+
+
+#-------------------------------------------------------------------------------------------
+def SyntheticTemplates (shape, empty_fraction=0., seed=0) :
+    # falling background and a Gaussian signal peak; a fraction of the cells gets no background,
+    # half of those keep their signal (signal-only cells), the others are empty
+    random_state = np.random.RandomState(seed)
+    shape = tuple(np.atleast_1d(shape))
+    grids = np.meshgrid(*[np.linspace(0., 1., n) for n in shape], indexing='ij')
+
+    b = 20.*np.exp(-2.*sum(grids))*random_state.uniform(0.5, 1.5, shape)/np.prod(shape)**0.5
+    s = 0.5*np.exp(-sum((g-0.5)**2 for g in grids)/0.02)
+
+    noBkg = random_state.rand(*shape) < empty_fraction
+    b[noBkg] = 0.
+    s[noBkg & (random_state.rand(*shape) < 0.5)] = 0.
+    return b, s
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def BenchmarkCases (grid='quick') :
+
+    config = GRIDS[grid]
+    cases = []
+    for N in config['N_experiments'] :
+        for n in config['bins_1D'] :
+            cases.append({'function': 'LogLikRatio', 'shape': [n], 'empty_fraction': 0., 'N_experiments': N})
+            cases.append({'function': 'LogLikRatioObserved', 'shape': [n], 'empty_fraction': 0., 'N_experiments': N})
+            cases.append({'function': 'GetQuantiles', 'shape': [n], 'empty_fraction': 0., 'N_experiments': N})
+            cases.append({'function': 'Histogram', 'shape': [n], 'empty_fraction': 0., 'N_experiments': N})
+        for shape in config['shapes_2D'] :
+            for f in config['empty_fractions'] :
+                cases.append({'function': 'LogLikRatio_TwoD', 'shape': list(shape), 'empty_fraction': f, 'N_experiments': N})
+                cases.append({'function': 'LogLikRatiosObserved', 'shape': list(shape), 'empty_fraction': f, 'N_experiments': N})
+            cases.append({'function': 'Histogram2D', 'shape': list(shape), 'empty_fraction': 0., 'N_experiments': N})
+    return cases
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CaseKey (case) :
+
+    return '%s|%s|%g|%d' %(case['function'], 'x'.join(str(n) for n in case['shape']),
+                           case['empty_fraction'], case['N_experiments'])
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def RunCase (case) :
+    # N_experiments is the number of toys, pseudo-datasets or filled events
+    b, s = SyntheticTemplates(case['shape'], case['empty_fraction'])
+    N = case['N_experiments']
+    random_state = np.random.RandomState(1)
+    function = case['function']
+    chunk_size = max(1, CHUNK_CELLS//b.size)
+
+    # one chunk of pseudo-datasets, evaluated N/chunk_size times
+    if function in ['LogLikRatioObserved', 'LogLikRatiosObserved'] :
+        datas = random_state.poisson(lam=b, size=(min(N, chunk_size),)+b.shape)
+        chunks = list(stat.ChunkSizes(N, chunk_size))
+
+    if function == 'LogLikRatio' :
+        run = lambda: stat.LogLikRatio(b, s, N, chunk_size, random_state)
+    elif function == 'LogLikRatio_TwoD' :
+        run = lambda: stat2D.LogLikRatio_TwoD(b, s, N, chunk_size=chunk_size, random_state=random_state)
+    elif function == 'LogLikRatioObserved' :
+        run = lambda: [stat.LogLikRatioObserved(b, [s], datas[:n]) for n in chunks]
+    elif function == 'LogLikRatiosObserved' :
+        run = lambda: [stat2D.LogLikRatiosObserved([b], [s], [datas[:n]]) for n in chunks]
+    elif function == 'GetQuantiles' :
+        llr = random_state.normal(size=N)
+        def run () :
+            hist, binning = np.histogram(llr, bins=b.size)
+            return stat.GetQuantiles(hist/float(N), binning)
+    elif function == 'Histogram' :
+        x = random_state.rand(N)
+        run = lambda: np.histogram(x, bins=np.linspace(0, 1, b.size+1))
+    elif function == 'Histogram2D' :
+        x, y = random_state.rand(2, N)
+        run = lambda: np.histogram2d(x, y, bins=b.shape)
+    else :
+        raise ValueError("Unknown benchmark function %s." %function)
+
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    run()
+    seconds = time.time() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kB on Linux
+    return {'seconds': seconds,
+            'peak_MB': peak_rss/1024.,
+            'increase_MB': (peak_rss - start_rss)/1024.}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def RunBenchmarks (cases, repeat=3, progress=True) :
+    # best of repeat runs, every run in a new process
+    results = {}
+    for k,case in enumerate(cases) :
+        runs = []
+        pool = None
+        try :
+            for r in xrange(repeat) :
+                pool = multiprocessing.Pool(processes=1)
+                runs.append(pool.apply(RunCase, (case,)))
+                pool.close()
+                pool.join()
+        except Exception as error :
+            if pool is not None :
+                pool.terminate()
+            results[CaseKey(case)] = dict(case, error=repr(error))
+            if progress :
+                print '%4d/%d %-40s failed: %r' %(k+1, len(cases), CaseKey(case), error)
+            continue
+
+        result = dict(case)
+        result['seconds'] = min(run['seconds'] for run in runs)
+        result['peak_MB'] = max(run['peak_MB'] for run in runs)
+        result['increase_MB'] = max(run['increase_MB'] for run in runs)
+        results[CaseKey(case)] = result
+        if progress :
+            print '%4d/%d %-40s %10.4f s %9.1f MB' %(k+1, len(cases), CaseKey(case), result['seconds'], result['increase_MB'])
+    return results
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SaveResults (results, path) :
+
+    meta = {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+    with open(path, 'w') as f :
+        json.dump({'meta': meta, 'results': results}, f, indent=1, sort_keys=True)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CompareResults (results, baseline, threshold=0.2, min_seconds=1e-3) :
+    # cases whose time or memory grew by more than threshold (relative); very fast cases are
+    # only compared once they take at least min_seconds
+    regressions = []
+    for key, result in sorted(results.items()) :
+        if key not in baseline or 'error' in result or 'error' in baseline[key] :
+            continue
+        old = baseline[key]
+        for quantity, floor in [('seconds', min_seconds), ('increase_MB', 1.)] :
+            if max(result[quantity], old[quantity]) < floor :
+                continue
+            ratio = result[quantity]/max(old[quantity], floor)
+            if ratio > 1. + threshold :
+                regressions.append((key, quantity, old[quantity], result[quantity], ratio))
+    return regressions
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Main () :
+
+    parser = argparse.ArgumentParser(description='Benchmark the stats and histogramming hot paths.')
+    parser.add_argument('--grid', choices=sorted(GRIDS), default='quick')
+    parser.add_argument('--function', action='append', help='only run these functions')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write the results as json')
+    parser.add_argument('--compare', help='json results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    cases = BenchmarkCases(args.grid)
+    if args.function :
+        cases = [case for case in cases if case['function'] in args.function]
+    results = RunBenchmarks(cases, args.repeat)
+
+    if args.save :
+        SaveResults(results, args.save)
+
+    if args.compare :
+        with open(args.compare) as f :
+            baseline = json.load(f)['results']
+        regressions = CompareResults(results, baseline, args.threshold)
+        for key, quantity, old, new, ratio in regressions :
+            print 'REGRESSION %-40s %-12s %10.4f -> %10.4f (x%.2f)' %(key, quantity, old, new, ratio)
+        if regressions :
+            return 1
+        print 'no regressions above %d%%' %(100*args.threshold)
+    return 0
+#-------------------------------------------------------------------------------------------
+
+
+if __name__ == '__main__' :
+    raise SystemExit(Main())
@@ -0,0 +1,204 @@
+import numpy as np
+import histindex
+
+"""
+Sensitivity-driven binning optimizer.
+Starting from fine s and b histograms, neighbouring bins are merged such that the expected
+Asimov significance Z^2 = sum 2((s+b)ln(1+s/b) - s) is maximal while every bin keeps at least
+min_background expected background events, so the templates have no empty or background-free
+bins. Z^2 is additive over bins, so with cumulative sums (1D) and summed-area tables (2D) every
+candidate bin is evaluated in O(1) and no toys are needed.
+
+In 1D the optimal edges are found exactly by dynamic programming (optionally with at most
+max_bins bins). In 2D the plane is split recursively into rectangles, each time taking the
+split with the largest gain (greedy, not guaranteed optimal), up to max_cells rectangles.
+
+    fine = np.linspace(50,130,161)
+    result = bn.OptimalBinnings(bkg_fine, sig_fine, fine, min_background=2., datas=data_fine)
+    result[0]['edges']                     # best edges for m_H = 85 GeV
+
+The optimization only uses the simulation; the data histograms are merged for convenience.
+"""
+
+#-------------------------------------------------------------------------------------------
+def BinScore (background, signal) :
+    # Asimov Z^2 contribution of one bin, -inf for bins without background
+    b = np.asarray(background, dtype=float)
+    s = np.asarray(signal, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore') :
+        score = 2*((s+b)*np.log(1+s/np.where(b > 0, b, 1.)) - s)
+    return np.where(b > 0, score, -np.inf)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def OptimalEdges (background, signal, base_edges, min_background=1., max_bins=None) :
+    # best merge of the fine 1D binning base_edges, returns (edges, Z)
+    b = np.asarray(background, dtype=float).ravel()
+    s = np.asarray(signal, dtype=float).ravel()
+    base_edges = np.asarray(base_edges, dtype=float)
+    n = len(b)
+    if b.sum() < min_background :
+        raise ValueError("Total background %g is below min_background %g." %(b.sum(), min_background))
+
+    B = np.concatenate([[0.], np.cumsum(b)])
+    S = np.concatenate([[0.], np.cumsum(s)])
+
+    # best[k,j]: best Z^2 of the first j fine bins merged into k bins; without max_bins all
+    # partitions share layer 1 (layer 0 is the empty start)
+    N_layers = 1 if max_bins is None else min(max_bins, n)
+    best = np.full((N_layers+1, n+1), -np.inf)
+    best[0,0] = 0.
+    start = np.zeros((N_layers+1, n+1), dtype=int)
+
+    for j in xrange(1, n+1) :
+        bb = B[j] - B[:j]
+        score = BinScore(bb, S[j] - S[:j])
+        score[bb < min_background] = -np.inf
+
+        if max_bins is None :
+            total = (np.maximum(best[0,:j], best[1,:j]) + score)[np.newaxis]
+        else :
+            total = best[:-1,:j] + score
+        start[1:,j] = np.argmax(total, axis=1)
+        best[1:,j] = total[np.arange(N_layers), start[1:,j]]
+
+    # walk back from the last fine bin
+    k = 1 if max_bins is None else int(np.argmax(best[1:,n])) + 1
+    Z2 = best[k,n]
+    if not np.isfinite(Z2) :
+        raise ValueError("No binning with at least %g background events per bin." %min_background)
+
+    cuts = [n]
+    j = n
+    while j > 0 :
+        j = start[k,j]
+        cuts.append(j)
+        if max_bins is not None :
+            k -= 1
+    return base_edges[cuts[::-1]], np.sqrt(max(Z2, 0.))
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SummedArea (hist) :
+    # T[i,j] = sum of hist[:i,:j]
+    T = np.zeros((hist.shape[0]+1, hist.shape[1]+1))
+    T[1:,1:] = np.cumsum(np.cumsum(hist, axis=0), axis=1)
+    return T
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def RectangleSum (T, x0, x1, y0, y1) :
+
+    return T[x1,y1] - T[x0,y1] - T[x1,y0] + T[x0,y0]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def BestSplit (TB, TS, cell, min_background) :
+    # (gain, axis, position) of the best split of one rectangle of fine bins
+    x0, x1, y0, y1 = cell
+    score = BinScore(RectangleSum(TB, x0, x1, y0, y1), RectangleSum(TS, x0, x1, y0, y1))
+
+    best = (-np.inf, None, None)
+    for axis, (lo, hi) in enumerate([(x0, x1), (y0, y1)]) :
+        p = np.arange(lo+1, hi)
+        if len(p) == 0 :
+            continue
+        if axis == 0 :
+            first = (x0, p, y0, y1)
+            second = (p, x1, y0, y1)
+        else :
+            first = (x0, x1, y0, p)
+            second = (x0, x1, p, y1)
+
+        b_first = RectangleSum(TB, *first)
+        b_second = RectangleSum(TB, *second)
+        gain = BinScore(b_first, RectangleSum(TS, *first)) + BinScore(b_second, RectangleSum(TS, *second)) - score
+        gain[(b_first < min_background) | (b_second < min_background)] = -np.inf
+
+        i = np.argmax(gain)
+        if gain[i] > best[0] :
+            best = (gain[i], axis, p[i])
+    return best
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def OptimalPartition (background, signal, base_edges, min_background=1., max_cells=20) :
+    # rectangular partition of the fine 2D binning base_edges = (edges_x, edges_y)
+    b = np.asarray(background, dtype=float)
+    s = np.asarray(signal, dtype=float)
+    if b.sum() < min_background :
+        raise ValueError("Total background %g is below min_background %g." %(b.sum(), min_background))
+    TB = SummedArea(b)
+    TS = SummedArea(s)
+
+    cells = [(0, b.shape[0], 0, b.shape[1])]
+    splits = [BestSplit(TB, TS, cells[0], min_background)]
+    while len(cells) < max_cells :
+        c = int(np.argmax([gain for gain, axis, p in splits]))
+        gain, axis, p = splits[c]
+        if not gain > 1e-12 :
+            break
+
+        x0, x1, y0, y1 = cells[c]
+        if axis == 0 :
+            new = [(x0, p, y0, y1), (p, x1, y0, y1)]
+        else :
+            new = [(x0, x1, y0, p), (x0, x1, p, y1)]
+        cells[c:c+1] = new
+        splits[c:c+1] = [BestSplit(TB, TS, cell, min_background) for cell in new]
+
+    cell_map = np.zeros(b.shape, dtype=int)
+    for k,(x0, x1, y0, y1) in enumerate(cells) :
+        cell_map[x0:x1,y0:y1] = k
+
+    edges_x = np.asarray(base_edges[0], dtype=float)
+    edges_y = np.asarray(base_edges[1], dtype=float)
+    rectangles = [(edges_x[x0], edges_x[x1], edges_y[y0], edges_y[y1]) for x0, x1, y0, y1 in cells]
+
+    Z2 = sum(BinScore(RectangleSum(TB, *cell), RectangleSum(TS, *cell)) for cell in cells)
+    return {'cells': cells,
+            'rectangles': rectangles,
+            'cell_map': cell_map,
+            'Z': np.sqrt(max(Z2, 0.))}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ApplyPartition (hist, cell_map) :
+    # fine 2D histogram -> vector of the partition cells (a 1D template for stats_2D)
+    return np.bincount(cell_map.ravel(), weights=np.asarray(hist, dtype=float).ravel(),
+                       minlength=cell_map.max()+1)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def OptimalBinnings (backgrounds, signals, base_edges, min_background=1., max_bins=None, datas=None) :
+    # one result per mass hypothesis; 2D if base_edges is a pair (edges_x, edges_y)
+    twoD = len(base_edges) == 2 and np.ndim(base_edges[0]) == 1
+    if datas is None :
+        datas = [None]*len(signals)
+
+    results = []
+    for background, signal, data in zip(backgrounds, signals, datas) :
+        if twoD :
+            result = OptimalPartition(background, signal, base_edges, min_background,
+                                      max_cells=20 if max_bins is None else max_bins)
+            merge = lambda hist: ApplyPartition(hist, result['cell_map'])
+        else :
+            edges, Z = OptimalEdges(background, signal, base_edges, min_background, max_bins)
+            result = {'edges': edges, 'Z': Z}
+            merge = lambda hist: histindex.MergeBins(np.asarray(hist, dtype=float).ravel(),
+                                                     np.asarray(base_edges, dtype=float), edges)
+
+        result['b'] = merge(background)
+        result['s'] = merge(signal)
+        if data is not None :
+            result['N'] = merge(data)
+        results.append(result)
+    return results
+#-------------------------------------------------------------------------------------------
@@ -0,0 +1,130 @@
+import numpy as np
+import stats as stat
+import stats_2D as stat2D
+
+"""
+Combination of several channels (e.g. the 1D mmis and the 2D mmis x composed analysis, or
+further variables) into one likelihood. Every channel keeps its own 1D or 2D binning; the
+histograms are flattened and concatenated into one bin vector, so the combined toys and the
+observed -2lnQ cost one Poisson draw and one dot product per chunk. The dot product is taken
+with a (N_bins, N_channels) weight matrix, which gives the contribution of every channel at the
+same time; -2lnQ of the combination is the sum over the channels.
+
+    channels = [cb.Channel('mmis', bkg_histos, sig_histos, data_histos),
+                cb.Channel('mmis x composed', bkgModels, sigModels, data_histModels)]
+    result = cb.Combination(channels, N_experiments=10000, random_state=1)
+    result[0]['CLs'], result[0]['CLs_channels']
+
+The channels are treated as statistically independent. The two channels above select largely
+the same events, so their combined CLs counts the shared events twice and overstates the
+sensitivity; the per-channel CLs are unaffected. For a valid combination the channels must not
+share events, e.g. split the selection into b-tag categories and give each its own variables.
+Bins are treated as in stats_2D (populated, signal-only and empty bins).
+"""
+
+#-------------------------------------------------------------------------------------------
+def Channel (name, backgrounds, signals, datas) :
+    # one histogram (any shape) per mass hypothesis
+    return {'name': name,
+            'backgrounds': backgrounds,
+            'signals': signals,
+            'datas': datas}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CombinedTemplate (channels, hypothesis=0) :
+    # stats_2D template of the concatenated bins plus the channel weight matrix
+    b = [np.asarray(c['backgrounds'][hypothesis], dtype=float).ravel() for c in channels]
+    s = [np.asarray(c['signals'][hypothesis], dtype=float).ravel() for c in channels]
+    template = stat2D.LogLikRatioTemplate(np.concatenate(b), np.concatenate(s))
+
+    sizes = [len(x) for x in b]
+    channel = np.repeat(np.arange(len(channels)), sizes)
+    matrix = np.zeros((len(template['populated']), len(channels)))
+    matrix[np.arange(len(template['populated'])), channel[template['populated']]] = template['weights']
+
+    template['channel_matrix'] = matrix
+    template['s_channels'] = np.array([x.sum() for x in s])
+    return template
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ChannelKernel (template, counts) :
+    # (N_toys, N_channels) -2lnQ contribution of every channel
+    return 2*template['s_channels'] - 2*np.dot(counts, template['channel_matrix'])
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CombinedLogLikRatio (channels, hypothesis=0, N_experiments=10000, chunk_size=100000, random_state=None) :
+    # (N_experiments, N_channels) toys for b-only and s+b; the combination is the sum over axis 1
+    template = CombinedTemplate(channels, hypothesis)
+    random_state = stat.GetRandomState(random_state)
+    b = template['b']
+    s = template['s']
+    lam_sPlusb = np.concatenate([s+b, template['s_sigOnly']])
+
+    llr_b_like = []
+    llr_sPlusb_like = []
+    N_divByZero = 0
+    for n in stat.ChunkSizes(N_experiments, chunk_size) :
+        N_b = random_state.poisson(lam=b, size=(n, len(b)))
+        # signal-only bins in the same s+b draw, as in stats_2D.LogLikRatioChunk
+        N_sPlusb = random_state.poisson(lam=lam_sPlusb, size=(n, len(lam_sPlusb)))
+
+        llr_b_like.append(ChannelKernel(template, N_b))
+        llr_sPlusb_like.append(ChannelKernel(template, N_sPlusb[:,:len(b)]))
+        N_divByZero += np.count_nonzero(N_sPlusb[:,len(b):])
+
+    empty = [np.zeros((0, len(channels)))]
+    counts = {'N_bins': template['N_bins'],
+              'N_emptyBins': template['N_emptyBins'],
+              'N_divByZero': N_divByZero}
+    return np.concatenate(llr_b_like+empty), np.concatenate(llr_sPlusb_like+empty), counts
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CombinedObserved (channels, hypothesis=0) :
+    # (N_channels,) observed -2lnQ contributions
+    template = CombinedTemplate(channels, hypothesis)
+    data = np.concatenate([np.asarray(c['datas'][hypothesis], dtype=float).ravel() for c in channels])
+    N, N_sigOnly = stat2D.SplitCounts(template, data)
+
+    counts = {'N_bins': template['N_bins'],
+              'N_emptyBins': template['N_emptyBins'],
+              'N_divByZero': np.count_nonzero(N_sigOnly)}
+    return ChannelKernel(template, N)[0], counts
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Combination (channels, N_experiments=10000, chunk_size=100000, random_state=None) :
+    # combined and per-channel CLs for every mass hypothesis
+    random_state = stat.GetRandomState(random_state)
+    N_hypotheses = len(channels[0]['signals'])
+
+    results = []
+    for h in xrange(N_hypotheses) :
+        llr_b_like, llr_sPlusb_like, counts = CombinedLogLikRatio(channels, h, N_experiments, chunk_size, random_state)
+        llr_obs_channels = CombinedObserved(channels, h)[0]
+        arrays = (llr_b_like.sum(axis=1), llr_sPlusb_like.sum(axis=1))
+        llr_obs = llr_obs_channels.sum()
+
+        OneMinusCLb, CLsPlusb, CLs = stat.GetCL(arrays, llr_obs)
+        CLs_channels = np.array([stat.GetCL((llr_b_like[:,c], llr_sPlusb_like[:,c]), llr_obs_channels[c])[2]
+                                 for c in xrange(len(channels))])
+
+        results.append({'channels': [c['name'] for c in channels],
+                        'arrays': arrays,
+                        'llr_obs': llr_obs,
+                        'OneMinusCLb': OneMinusCLb,
+                        'CLs': CLs,
+                        'arrays_channels': (llr_b_like, llr_sPlusb_like),
+                        'llr_obs_channels': llr_obs_channels,
+                        'CLs_channels': CLs_channels,
+                        'counts': counts})
+    return results
+#-------------------------------------------------------------------------------------------
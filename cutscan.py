@@ -0,0 +1,83 @@
+import numpy as np
+import stats as stat
+
+"""
+Fast scan of a cut 'score > threshold' on a classifier output (e.g. BDT_selCut85).
+Every event is assigned once to its histogram bin and to the number of thresholds it passes.
+One bincount then gives the histograms of the events passing exactly k thresholds, and a
+cumulative sum over k the s, b and N histograms for every threshold at once. The sensitivity
+is evaluated with stats.AsimovSensitivity, so no toys are needed during the scan.
+
+    scan = cs.CutScan(sig_frame, framesMC_NoHiggs, data, 'mmis', np.linspace(50,130,28),
+                      np.linspace(-5,0,1000), score='BDT_selCut85')
+    scan['best']
+"""
+
+#-------------------------------------------------------------------------------------------
+def BinIndex (values, binning) :
+    # as np.histogram: bins are [lo, hi) except the last one, which is [lo, hi]; -1 outside
+    binning = np.asarray(binning, dtype=float)
+    index = np.searchsorted(binning, values, side='right') - 1
+    index[values == binning[-1]] = len(binning) - 2
+    index[(index < 0) | (index >= len(binning)-1)] = -1
+    return index
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CumulativeHistograms (scores, values, weights, binning, thresholds) :
+    # (N_thresholds, N_bins) histograms of the events with score > thresholds[j]
+    thresholds = np.asarray(thresholds, dtype=float)
+    N_bins = len(binning)-1
+    N_thresholds = len(thresholds)
+
+    order = np.argsort(thresholds)
+    index = BinIndex(np.asarray(values, dtype=float), binning)
+    passed = np.searchsorted(thresholds[order], np.asarray(scores, dtype=float), side='left')
+
+    inside = index >= 0
+    exact = np.bincount(passed[inside]*N_bins + index[inside],
+                        weights=None if weights is None else np.asarray(weights, dtype=float)[inside],
+                        minlength=(N_thresholds+1)*N_bins).reshape(N_thresholds+1, N_bins)
+
+    # events passing more than j (sorted) thresholds pass threshold j
+    cumulative = np.cumsum(exact[::-1], axis=0)[::-1][1:]
+    histograms = np.empty_like(cumulative, dtype=float)
+    histograms[order] = cumulative
+    return histograms
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SampleHistograms (samples, column, binning, thresholds, score, weight='weight') :
+    # sum over one or several samples (DataFrame or eventstore.LazySample)
+    if not isinstance(samples, (list, tuple)) :
+        samples = [samples]
+
+    histograms = np.zeros((len(thresholds), len(binning)-1))
+    for sample in samples :
+        weights = sample[weight] if weight in sample else None
+        histograms += CumulativeHistograms(sample[score], sample[column], weights, binning, thresholds)
+    return histograms
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CutScan (signals, backgrounds, datas, column, binning, thresholds, score='BDT_selCut85', weight='weight') :
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    s = SampleHistograms(signals, column, binning, thresholds, score, weight)
+    b = SampleHistograms(backgrounds, column, binning, thresholds, score, weight)
+    N = SampleHistograms(datas, column, binning, thresholds, score, weight=None)
+
+    sensitivity = stat.AsimovSensitivity(b, s)
+    best = np.nanargmin(sensitivity['CLs'])
+
+    return {'thresholds': thresholds,
+            's': s,
+            'b': b,
+            'N': N,
+            'CLs': sensitivity['CLs'],
+            'Z': sensitivity['Z'],
+            'best': thresholds[best]}
+#-------------------------------------------------------------------------------------------
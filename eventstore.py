@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+import os
+import json
+
+"""
+Binary columnar cache for the event samples.
+A sample is stored as one typed .npy file per column plus a meta.json (column names, dtypes,
+number of events and size/mtime of the source CSV). Columns are opened memory-mapped, so only
+the columns (and pages) that are actually used are read. LoadSample converts the CSV on first
+use and whenever the source file changed.
+
+    higgs_85 = es.LoadSample('data/higgs_higgs_85.csv', columns=['mmis','btag1','btag2'])
+    es.SaveFrame(data_85, 'data_85')      # instead of data_85.to_csv('data_85')
+    data_85 = es.LoadFrame('data_85')
+"""
+
+CACHE_DIR = os.path.join('data', '.columns')
+
+
+#-------------------------------------------------------------------------------------------
+def SourceStamp (csv_path) :
+
+    return {'path': os.path.abspath(csv_path),
+            'size': os.path.getsize(csv_path),
+            'mtime': os.path.getmtime(csv_path)}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SampleDir (csv_path, cache_dir=None) :
+    # data/higgs_qq.csv -> data/.columns/higgs_qq
+    if cache_dir is None :
+        cache_dir = os.path.join(os.path.dirname(csv_path), '.columns')
+    return os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0])
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ReadMeta (directory) :
+
+    path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(path) :
+        return None
+    with open(path, 'r') as f :
+        return json.load(f)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SaveColumns (df, directory, source=None, meta_extra=None) :
+    # one file per column, meta.json is written last so a half written cache is never valid
+    if not os.path.exists(directory) :
+        os.makedirs(directory)
+    if os.path.exists(os.path.join(directory, 'meta.json')) :
+        os.remove(os.path.join(directory, 'meta.json'))
+
+    columns = []
+    for k,column in enumerate(df.columns) :
+        values = np.asarray(df[column].values)
+        if values.dtype == object :
+            values = values.astype(np.unicode_)
+        filename = '%03i.npy' %k
+        np.save(os.path.join(directory, filename), values)
+        columns.append({'name': column, 'file': filename, 'dtype': values.dtype.str})
+
+    meta = {'columns': columns, 'N_events': len(df), 'source': source}
+    if meta_extra is not None :
+        meta.update(meta_extra)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f :
+        json.dump(meta, f, indent=1)
+    return meta
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def AddColumns (directory, columns, meta_extra=None) :
+    # columns: dict name -> array with N_events entries, added to (or replacing in) an existing cache
+    meta = ReadMeta(directory)
+    files = dict((c['name'], c['file']) for c in meta['columns'])
+
+    for name in columns :
+        values = np.asarray(columns[name])
+        if len(values) != meta['N_events'] :
+            raise ValueError("Column %s has %i entries, expected %i." %(name, len(values), meta['N_events']))
+        if name not in files :
+            files[name] = '%03i.npy' %len(meta['columns'])
+            meta['columns'].append({'name': name, 'file': files[name], 'dtype': values.dtype.str})
+        np.save(os.path.join(directory, files[name]), values)
+        for c in meta['columns'] :
+            if c['name'] == name :
+                c['dtype'] = values.dtype.str
+
+    if meta_extra is not None :
+        meta.update(meta_extra)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f :
+        json.dump(meta, f, indent=1)
+    return meta
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+class LazySample (object) :
+    # dict-like view of a cached sample, every column is memory-mapped on first access
+
+    def __init__ (self, directory, columns=None, mmap=True) :
+        self.directory = directory
+        self.meta = ReadMeta(directory)
+        self.files = dict((c['name'], c['file']) for c in self.meta['columns'])
+        self.columns = [c['name'] for c in self.meta['columns']]
+        if columns is not None :
+            self.columns = [c for c in self.columns if c in columns]
+        self.mmap_mode = 'r' if mmap else None
+        self.loaded = {}
+
+    def __getitem__ (self, column) :
+        if column not in self.loaded :
+            if column not in self.columns :
+                raise KeyError(column)
+            self.loaded[column] = np.load(os.path.join(self.directory, self.files[column]), mmap_mode=self.mmap_mode)
+        return self.loaded[column]
+
+    def __contains__ (self, column) :
+        return column in self.columns
+
+    def __len__ (self) :
+        return self.meta['N_events']
+
+    def keys (self) :
+        return list(self.columns)
+
+    def to_frame (self, columns=None) :
+        if columns is None :
+            columns = self.columns
+        return pd.DataFrame(dict((c, self[c]) for c in columns), columns=columns)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def IsCacheValid (csv_path, directory) :
+
+    meta = ReadMeta(directory)
+    if meta is None or meta.get('source') is None :
+        return False
+    stamp = SourceStamp(csv_path)
+    return meta['source']['size'] == stamp['size'] and meta['source']['mtime'] == stamp['mtime']
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ConvertCSV (csv_path, cache_dir=None) :
+    # one-time conversion, the CSV is parsed here and never again while it is unchanged
+    directory = SampleDir(csv_path, cache_dir)
+    stamp = SourceStamp(csv_path)
+    SaveColumns(pd.read_csv(csv_path), directory, source=stamp)
+    return directory
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def OpenSample (csv_path, columns=None, cache_dir=None, mmap=True) :
+    # lazy access, converts the CSV if there is no valid cache yet
+    directory = SampleDir(csv_path, cache_dir)
+    if not IsCacheValid(csv_path, directory) :
+        ConvertCSV(csv_path, cache_dir)
+    return LazySample(directory, columns, mmap)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LoadSample (csv_path, columns=None, cache_dir=None) :
+    # drop-in for pd.read_csv(csv_path)[columns]
+    return OpenSample(csv_path, columns, cache_dir).to_frame(columns)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SaveFrame (df, name, cache_dir=CACHE_DIR) :
+    # intermediate results (e.g. events after the selection cuts)
+    return SaveColumns(df, os.path.join(cache_dir, name))
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LoadFrame (name, columns=None, cache_dir=CACHE_DIR) :
+
+    return LazySample(os.path.join(cache_dir, name), columns).to_frame(columns)
+#-------------------------------------------------------------------------------------------
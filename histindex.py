@@ -0,0 +1,135 @@
+import numpy as np
+import cutscan
+
+"""
+Pre-binned event index.
+Every event gets its bin id on a fine base grid once per variable. A histogram on any binning
+whose edges are a subset of the base edges is then a (cached) np.bincount on the base grid plus
+a merge of neighbouring base bins, for 1D and 2D, with sum of weights and sum of weights squared.
+
+    index = hi.BuildIndex(qq, {'mmis': np.linspace(50,130,161), 'composed_85': np.linspace(-14,8,221)})
+    sumw, sumw2 = hi.Histogram(index, 'mmis', np.linspace(50,130,17), mask, mask_key=cuts_85)
+    sumw, sumw2 = hi.Histogram2D(index, 'mmis', 'composed_85', (edges1, edges2), mask, mask_key=cuts_85)
+
+mask_key is any hashable description of the mask, lists (e.g. the (label, cut) pairs of
+selection.SelectionCuts) are turned into tuples. Events exactly on a base edge are kept apart, so
+the last bin of a coarse binning is closed as in np.histogram also where its last edge lies
+inside the base grid.
+
+Choose the base grid as a common refinement of all binnings (e.g. np.linspace(50,130,28) needs
+a base step of 80/27/k). Integer bin counts as in np.histogram2d(..., bins=(7,6)) depend on the
+data range and have to be given as explicit edges.
+"""
+
+#-------------------------------------------------------------------------------------------
+def BuildIndex (sample, base_binnings, weight='weight') :
+    # base_binnings: dict variable -> fine edges
+    weights = np.asarray(sample[weight], dtype=float) if weight in sample else np.ones(len(sample))
+
+    index = {'edges': {}, 'ids': {}, 'onEdge': {}, 'weights': weights, 'cache': {}}
+    for variable, edges in base_binnings.items() :
+        edges = np.asarray(edges, dtype=float)
+        values = np.asarray(sample[variable], dtype=float)
+        ids = cutscan.BinIndex(values, edges)
+        index['edges'][variable] = edges
+        index['ids'][variable] = ids
+        # events exactly on the lower edge of their base bin
+        index['onEdge'][variable] = (ids >= 0) & (values == edges[np.maximum(ids, 0)])
+    return index
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def HashableKey (key) :
+    # lists (e.g. selection cuts) -> tuples, recursively
+    if isinstance(key, (list, tuple)) :
+        return tuple(HashableKey(k) for k in key)
+    return key
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def BaseHistogram (index, variables, mask=None, mask_key=None, split=False) :
+    # (sumw, sumw2) on the base grid of one or two variables, cached if mask_key is given;
+    # split: every base bin as two cells, events on its lower edge and all others
+    key = (tuple(variables), HashableKey(mask_key))
+    if (mask is None or mask_key is not None) and key in index['cache'] :
+        sumw, sumw2 = index['cache'][key]
+    else :
+        sumw, sumw2 = SplitHistogram(index, variables, mask)
+        if mask is None or mask_key is not None :
+            index['cache'][key] = (sumw, sumw2)
+
+    if split :
+        return sumw, sumw2
+    shape = [n for v in variables for n in (len(index['edges'][v])-1, 2)]
+    axes = tuple(range(1, len(shape), 2))
+    return sumw.reshape(shape).sum(axis=axes), sumw2.reshape(shape).sum(axis=axes)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SplitHistogram (index, variables, mask=None) :
+
+    shape = tuple(2*(len(index['edges'][v])-1) for v in variables)
+    ids = np.zeros(len(index['weights']), dtype=np.int64)
+    inside = np.ones(len(index['weights']), dtype=bool)
+    for v,n in zip(variables, shape) :
+        ids = ids*n + 2*index['ids'][v] + 1 - index['onEdge'][v]
+        inside &= index['ids'][v] >= 0
+    if mask is not None :
+        inside &= mask
+
+    weights = index['weights'][inside]
+    size = int(np.prod(shape))
+    sumw = np.bincount(ids[inside], weights=weights, minlength=size).reshape(shape)
+    sumw2 = np.bincount(ids[inside], weights=weights**2, minlength=size).reshape(shape)
+    return sumw, sumw2
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def MergeBins (hist, base_edges, edges, axis=0, split=False) :
+    # sum the base bins between neighbouring edges; edges have to be a subset of base_edges
+    # split: hist from BaseHistogram(..., split=True), the last bin then includes its upper edge
+    edges = np.asarray(edges, dtype=float)
+    pos = np.searchsorted(base_edges, edges)
+    pos = np.minimum(pos, len(base_edges)-1)
+    left = np.maximum(pos-1, 0)
+    pos = np.where(np.abs(base_edges[left]-edges) < np.abs(base_edges[pos]-edges), left, pos)
+    scale = max(1., np.abs(base_edges).max())
+    if not np.allclose(base_edges[pos], edges, rtol=0, atol=1e-9*scale) :
+        raise ValueError("Binning is not a merge of the base grid.")
+
+    if split :
+        last = min(2*pos[-1]+1, hist.shape[axis])
+        hist = np.take(hist, np.arange(2*pos[0], last), axis=axis)
+        return np.add.reduceat(hist, 2*(pos[:-1]-pos[0]), axis=axis)
+
+    hist = np.take(hist, np.arange(pos[0], pos[-1]), axis=axis)
+    return np.add.reduceat(hist, pos[:-1]-pos[0], axis=axis)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Histogram (index, variable, binning, mask=None, mask_key=None) :
+
+    sumw, sumw2 = BaseHistogram(index, [variable], mask, mask_key, split=True)
+    edges = index['edges'][variable]
+    return MergeBins(sumw, edges, binning, split=True), MergeBins(sumw2, edges, binning, split=True)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Histogram2D (index, variable1, variable2, binning, mask=None, mask_key=None) :
+    # binning = (edges1, edges2) as for np.histogram2d
+    sumw, sumw2 = BaseHistogram(index, [variable1, variable2], mask, mask_key, split=True)
+    edges1 = index['edges'][variable1]
+    edges2 = index['edges'][variable2]
+
+    hists = []
+    for hist in [sumw, sumw2] :
+        hist = MergeBins(hist, edges1, binning[0], axis=0, split=True)
+        hists.append(MergeBins(hist, edges2, binning[1], axis=1, split=True))
+    return hists[0], hists[1]
+#-------------------------------------------------------------------------------------------
@@ -0,0 +1,110 @@
+import numpy as np
+from scipy.stats import norm
+import stats as stat
+import stats_2D as stat2D
+
+"""
+Importance-sampled toys for deep tails of the b-only -2ln(Q) distribution.
+Toys are drawn from the tilted model b + mu_tilt*s and reweighted to the b-only model with
+    P_b(N)/P_tilt(N) = exp(mu_tilt*s_tot - N*log(1+mu_tilt*s/b))
+By default mu_tilt puts the mean of the tilted -2ln(Q) on the observed value, so that most toys
+land in the tail one is interested in (1-CL_b = P_b(-2lnQ < obs)).
+Signal-only and empty bins are treated as in stats_2D.
+"""
+
+#-------------------------------------------------------------------------------------------
+def TiltStrength (template, obs) :
+    # mu with E_{b+mu*s}[-2lnQ] = obs, not below 0 (plain b-only toys)
+    b = template['b']
+    s = template['s']
+    weights = template['weights']
+    slope = 2*np.dot(s, weights)
+    if slope <= 0 :
+        return 0.
+    return max(0., (2*template['s_tot'] - 2*np.dot(b, weights) - obs)/slope)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def TiltedToys (template, mu_tilt, N_experiments=100000, chunk_size=100000, random_state=None) :
+    # yields (llr, weight) chunks of toys drawn from b + mu_tilt*s, weights to the b-only model
+    random_state = stat.GetRandomState(random_state)
+    b = template['b']
+    s = template['s']
+    log_ratio = np.log(1+mu_tilt*s/b)
+
+    for n in stat.ChunkSizes(N_experiments, chunk_size) :
+        N = random_state.poisson(lam=b+mu_tilt*s, size=(n, len(b)))
+        llr = stat2D.LogLikRatioKernel(template, N)[0]
+        weight = np.exp(mu_tilt*s.sum() - np.dot(N, log_ratio))
+        yield llr, weight
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def TailProbability (template, obs, mu_tilt, N_experiments=100000, chunk_size=100000, random_state=None) :
+
+    N = 0
+    sum_w = 0.
+    sum_w2 = 0.
+    for llr, weight in TiltedToys(template, mu_tilt, N_experiments, chunk_size, random_state) :
+        w = weight*(llr < obs)
+        N += len(llr)
+        sum_w += w.sum()
+        sum_w2 += (w**2).sum()
+
+    p = sum_w/N
+    p_error = np.sqrt(max(sum_w2/N - p**2, 0.)/N)
+
+    return {'OneMinusCLb': p,
+            'error': p_error,
+            'Z': norm.isf(p),
+            'Z_error': p_error/norm.pdf(norm.isf(p)) if p > 0 else np.inf,
+            'mu_tilt': mu_tilt,
+            'N_eff': sum_w**2/sum_w2 if sum_w2 > 0 else 0.}   # effective number of tail toys
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioTail (background, signal, obs, N_experiments=100000, mu_tilt=None, chunk_size=100000, random_state=None) :
+    # 1-CL_b = P_b(-2lnQ < obs) with its statistical error and significance Z
+    # obs may be an array, every value then gets its own tilt (unless mu_tilt is given)
+    template = stat2D.LogLikRatioTemplate(background, signal)
+    random_state = stat.GetRandomState(random_state)
+
+    results = []
+    for o in np.atleast_1d(obs) :
+        mu = TiltStrength(template, o) if mu_tilt is None else mu_tilt
+        results.append(TailProbability(template, o, mu, N_experiments, chunk_size, random_state))
+
+    if np.ndim(obs) == 0 :
+        return results[0]
+    return results
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ExpectedSignificance (background, signal, N_experiments=100000, chunk_size=100000, random_state=None) :
+    # median expected 1-CL_b for s+b data: toys tilted with mu=1 *are* s+b toys, so the same toys
+    # give the median observation and (reweighted) the b-only tail below it
+    template = stat2D.LogLikRatioTemplate(background, signal)
+
+    llr = []
+    weight = []
+    for llr_chunk, weight_chunk in TiltedToys(template, 1., N_experiments, chunk_size, random_state) :
+        llr.append(llr_chunk)
+        weight.append(weight_chunk)
+    llr = np.concatenate(llr)
+    weight = np.concatenate(weight)
+
+    median = np.median(llr)
+    w = weight*(llr < median)
+    p = w.mean()
+    p_error = w.std()/np.sqrt(len(w))
+
+    return {'median': median,
+            'OneMinusCLb': p,
+            'error': p_error,
+            'Z': norm.isf(p),
+            'Z_error': p_error/norm.pdf(norm.isf(p)) if p > 0 else np.inf}
+#-------------------------------------------------------------------------------------------
@@ -0,0 +1,148 @@
+import numpy as np
+from scipy.optimize import brentq
+import stats as stat
+
+"""
+Upper limits on the signal strength mu (signal = mu * nominal signal template).
+One toy ensemble of bin counts is drawn, half of it b-only and half with signal strength
+mu_ref. For every trial mu the test statistic
+    -2lnQ(mu) = 2 mu s_tot - 2 sum N ln(1 + mu s/b)
+is re-evaluated on the stored counts and the toys are reweighted analytically with the Poisson
+likelihood ratio to the b-only and the mu s+b hypothesis,
+    p_mu(N)/p_0(N) = exp(-mu s_tot + sum N ln(1 + mu s/b)),
+so the root search for CLs(mu) = 1 - CL needs no new toys. Drawing from the mixture of both
+hypotheses keeps the weights well behaved from mu = 0 up to a few times mu_ref.
+
+    limits = lm.UpperLimits(bkg_histos, sig_histos, data_histos, N_experiments=20000)
+    limits['mu_obs'], limits['mu_median'], limits['mu_oneSigma']
+
+Bins without background only enter via the constant 2 mu s_tot, as in stats_2D.
+"""
+
+#-------------------------------------------------------------------------------------------
+def LimitToys (background, signal, N_experiments=20000, mu_ref=1., chunk_size=10000, random_state=None) :
+    # (N_experiments, N_populated) counts, first half b-only, second half mu_ref s+b
+    random_state = stat.GetRandomState(random_state)
+    b = np.asarray(background, dtype=float).ravel()
+    s = np.asarray(signal, dtype=float).ravel()
+    populated = b > 0
+    b = b[populated]
+    s = s[populated]
+
+    counts = []
+    N_b = N_experiments//2
+    for mu, N in [(0., N_b), (mu_ref, N_experiments-N_b)] :
+        for n in stat.ChunkSizes(N, chunk_size) :
+            counts.append(random_state.poisson(lam=b+mu*s, size=(n, len(b))))
+    return np.concatenate(counts)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LimitTemplate (background, signal, counts, mu_ref) :
+
+    b = np.asarray(background, dtype=float).ravel()
+    s = np.asarray(signal, dtype=float).ravel()
+    populated = b > 0
+    template = {'b': b[populated],
+                's': s[populated],
+                's_tot': s.sum(),
+                'counts': counts,
+                'mu_ref': mu_ref}
+
+    # log of the proposal density (1/2 p_0 + 1/2 p_mu_ref) relative to p_0
+    template['log_proposal'] = np.logaddexp(0., LogLikelihoodRatio(template, counts, mu_ref)) - np.log(2.)
+    return template
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikelihoodRatio (template, counts, mu) :
+    # ln p_mu(N)/p_0(N) on the populated bins
+    return -mu*template['s'].sum() + np.dot(counts, np.log1p(mu*template['s']/template['b']))
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioMu (template, counts, mu) :
+
+    return 2*mu*template['s_tot'] - 2*np.dot(counts, np.log1p(mu*template['s']/template['b']))
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Reweighted (template, mu) :
+    # -2lnQ(mu) of the stored toys, sorted with the cumulative b-only and mu s+b probabilities
+    llr = LogLikRatioMu(template, template['counts'], mu)
+    log_w = -template['log_proposal']
+    w_b = np.exp(log_w - log_w.max())
+    log_w = log_w + LogLikelihoodRatio(template, template['counts'], mu)
+    w_sPlusb = np.exp(log_w - log_w.max())
+
+    sorted_llr = [stat.SortDistribution(llr, w_b/w_b.sum()),
+                  stat.SortDistribution(llr, w_sPlusb/w_sPlusb.sum())]
+    N_eff = w_sPlusb.sum()**2/(w_sPlusb**2).sum()
+    return sorted_llr, N_eff
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CLsMu (template, mu, obs=None, quantile=None) :
+    # CLs at signal strength mu for observed counts obs or at a b-only quantile index
+    # (0: median, 1/2: -+1 sigma, 3/4: -+2 sigma as in stats.QuantilesFromSorted)
+    sorted_llr, N_eff = Reweighted(template, mu)
+    if obs is not None :
+        llr_obs = LogLikRatioMu(template, obs, mu)
+    else :
+        Median, OneSigma, TwoSigma = stat.QuantilesFromSorted(*sorted_llr[0])
+        llr_obs = ([Median]+OneSigma+TwoSigma)[quantile]
+    return stat.CLFromSorted(sorted_llr, llr_obs)[2]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SolveLimit (function, alpha, mu_start, xtol=1e-3, max_doublings=20) :
+    # CLs(mu) falls from 1 at mu = 0; bracket the crossing by doubling, then brentq
+    mu_hi = mu_start
+    for i in xrange(max_doublings) :
+        if function(mu_hi) < alpha :
+            return brentq(lambda mu: function(mu) - alpha, 0., mu_hi, xtol=xtol*mu_start)
+        mu_hi *= 2
+    return np.nan
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def UpperLimit (background, signal, data, N_experiments=20000, mu_ref=1., CL=0.95, chunk_size=10000,
+                random_state=None) :
+    # observed and expected upper limits on mu for one mass hypothesis
+    counts = LimitToys(background, signal, N_experiments, mu_ref, chunk_size, random_state)
+    template = LimitTemplate(background, signal, counts, mu_ref)
+    alpha = 1. - CL
+
+    obs = np.asarray(data, dtype=float).ravel()[np.asarray(background).ravel() > 0]
+    mu_obs = SolveLimit(lambda mu: CLsMu(template, mu, obs=obs), alpha, mu_ref)
+    mu_exp = np.array([SolveLimit(lambda mu: CLsMu(template, mu, quantile=q), alpha, mu_ref)
+                       for q in xrange(5)])
+
+    return {'mu_obs': mu_obs,
+            'mu_median': mu_exp[0],
+            'mu_oneSigma': np.sort(mu_exp[1:3]),
+            'mu_twoSigma': np.sort(mu_exp[3:5]),
+            'N_eff': Reweighted(template, mu_exp[0])[1] if np.isfinite(mu_exp[0]) else np.nan}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def UpperLimits (backgrounds, signals, datas, N_experiments=20000, mu_ref=1., CL=0.95, chunk_size=10000,
+                 random_state=None, m_H=[85,90,95]) :
+    # one UpperLimit per mass point, stacked into arrays
+    random_state = stat.GetRandomState(random_state)
+    limits = [UpperLimit(background, signal, data, N_experiments, mu_ref, CL, chunk_size, random_state)
+              for background, signal, data in zip(backgrounds, signals, datas)]
+
+    result = {'masses': m_H}
+    for key in limits[0] :
+        result[key] = np.array([limit[key] for limit in limits])
+    return result
+#-------------------------------------------------------------------------------------------
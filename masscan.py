@@ -0,0 +1,107 @@
+import numpy as np
+import stats as stat
+
+"""
+Mass scan over an arbitrary grid of Higgs masses.
+Signal templates between the simulated points (85, 90, 95 GeV) are interpolated bin by bin,
+all hypotheses are stacked into one (N_hypotheses, N_bins) matrix, and for one common background
+the b-only toys are drawn once and evaluated for every hypothesis with a single matrix product.
+
+    grid = np.arange(80., 100.01, 0.5)
+    signals = ms.InterpolateSignals([85,90,95], sig_histos, grid, extrapolate=True)
+    scan = ms.MassScan(bkg, signals, data_hist, N_experiments=10000, masses=grid)
+    pl.CLsScanPlot(scan)
+
+Outside the simulated masses the templates are only extrapolated with extrapolate=True, linearly
+from the two outermost simulated points (negative contents set to 0); without it a grid beyond
+85-95 GeV raises ValueError. Extrapolated points are less reliable than interpolated ones.
+"""
+
+#-------------------------------------------------------------------------------------------
+def InterpolateSignals (masses, signals, mass_grid, extrapolate=False) :
+    # linear interpolation of every bin between the neighbouring simulated masses
+    masses = np.asarray(masses, dtype=float)
+    signals = np.asarray(signals, dtype=float)
+    mass_grid = np.asarray(mass_grid, dtype=float)
+    if not extrapolate and (mass_grid.min() < masses.min() or mass_grid.max() > masses.max()) :
+        raise ValueError("Mass grid %g-%g is outside of the simulated masses %g-%g."
+                         %(mass_grid.min(), mass_grid.max(), masses.min(), masses.max()))
+
+    order = np.argsort(masses)
+    masses = masses[order]
+    signals = signals[order]
+
+    j = np.clip(np.searchsorted(masses, mass_grid, side='right')-1, 0, len(masses)-2)
+    frac = (mass_grid - masses[j])/(masses[j+1] - masses[j])
+    frac = frac.reshape((-1,)+(1,)*(signals.ndim-1))
+    return np.maximum((1-frac)*signals[j] + frac*signals[j+1], 0.)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def MassScanToys (background, signals, N_experiments=10000, chunk_size=5000, random_state=None) :
+    # (N_experiments, N_hypotheses) arrays of -2lnQ for b-only and s+b toys
+    random_state = stat.GetRandomState(random_state)
+    b = np.asarray(background, dtype=float).ravel()
+    S = np.asarray(signals, dtype=float).reshape(len(signals), -1)
+
+    populated = b > 0
+    s_tot = S.sum(axis=1)
+    b = b[populated]
+    S = S[:,populated]
+    W = np.log(1+S/b)
+
+    llr_b_like = []
+    llr_sPlusb_like = []
+    for n in stat.ChunkSizes(N_experiments, chunk_size) :
+        N_b = random_state.poisson(lam=b, size=(n, len(b)))
+        llr_b_like.append(2*s_tot - 2*np.dot(N_b, W.T))
+
+        N_sPlusb = random_state.poisson(lam=b+S, size=(n,)+S.shape)
+        llr_sPlusb_like.append(2*s_tot - 2*np.einsum('khi,hi->kh', N_sPlusb, W))
+
+    return np.concatenate(llr_b_like), np.concatenate(llr_sPlusb_like)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def MassScanObserved (background, signals, data) :
+
+    b = np.asarray(background, dtype=float).ravel()
+    S = np.asarray(signals, dtype=float).reshape(len(signals), -1)
+    N = np.asarray(data, dtype=float).ravel()
+
+    populated = b > 0
+    W = np.log(1+S[:,populated]/b[populated])
+    return 2*S.sum(axis=1) - 2*np.dot(W, N[populated])
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def MassScan (background, signals, data, N_experiments=10000, chunk_size=5000, random_state=None, masses=None) :
+    # observed and expected (median, +-1 sigma, +-2 sigma for b-only data) CLs over the grid
+    llr_b_like, llr_sPlusb_like = MassScanToys(background, signals, N_experiments, chunk_size, random_state)
+    llr_obs = MassScanObserved(background, signals, data)
+
+    N_hypotheses = len(signals)
+    CLs_obs = np.zeros(N_hypotheses)
+    CLs_exp = np.zeros((N_hypotheses, 5))
+    arrays = []
+    for h in xrange(N_hypotheses) :
+        arrays.append((llr_b_like[:,h], llr_sPlusb_like[:,h]))
+        sorted_llr = stat.SortedLLR(arrays[h])
+        CLs_obs[h] = stat.CLFromSorted(sorted_llr, llr_obs[h])[2]
+
+        # b-only pseudo-observations at the median and the +-1/2 sigma quantiles
+        Median, OneSigma, TwoSigma = stat.QuantilesFromSorted(*sorted_llr[0])
+        obs = np.array([Median]+OneSigma+TwoSigma)
+        CLs_exp[h] = stat.CLFromSorted(sorted_llr, obs)[2]
+
+    return {'masses': masses,
+            'llr_obs': llr_obs,
+            'CLs_obs': CLs_obs,
+            'CLs_median': CLs_exp[:,0],
+            'CLs_oneSigma': np.sort(CLs_exp[:,1:3], axis=1),
+            'CLs_twoSigma': np.sort(CLs_exp[:,3:5], axis=1),
+            'arrays': arrays}
+#-------------------------------------------------------------------------------------------
@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+import os
+import json
+import hashlib
+import itertools
+import cPickle
+from sklearn.model_selection import train_test_split
+from sklearn.ensemble import GradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression
+import stats as stat
+import cutscan
+import scoring
+import parallel
+
+"""
+Hyperparameter and feature-set scan for the selection classifiers.
+The weighted feature matrix of signal and background is built once and kept in a module
+global, which the workers of the process pool inherit read-only (fork). Every combination of
+model x hyperparameters x feature subset is trained once; for GradientBoosting the test sample
+is evaluated with staged_decision_function, so one boosting run gives all requested
+n_estimators values. Every fitted model is pickled (usable with scoring.ScoreSample) next to a
+json file with its feature list, its weighted test score and the expected CLs after the best cut
+on the score, from the Asimov approximation on the test sample (stats.AsimovSensitivity).
+Combinations already in output_dir are not trained again.
+
+    dataset = mv.BuildDataset(higgs_85, framesMC_NoHiggs)
+    grid = {'GradientBoosting': {'max_depth': [2,3,4], 'learning_rate': [0.01,0.1],
+                                 'n_estimators': [100,200,300], 'random_state': [0]},
+            'LogisticRegression': {'C': [1.,100.]}}
+    results = mv.MVAScan(dataset, grid, mv.LeaveOneOut(scoring.FEATURES), processes=4)
+    results.head()
+    best = results.iloc[0]
+    sample = scoring.ScoreSample('data/higgs_qq.csv', {'BDT_selCut85': best['path']}, best['features'])
+"""
+
+# classifiers with a decision_function, as needed by scoring.ScoreSample
+MODELS = {'GradientBoosting': GradientBoostingClassifier,
+          'LogisticRegression': LogisticRegression}
+
+SCAN_DIR = os.path.join('data', '.mvascan')
+
+# shared with the pool workers, set by MVAScan
+DATASET = None
+
+
+#-------------------------------------------------------------------------------------------
+def BuildDataset (signal, backgrounds, features=scoring.FEATURES, column='mmis', weight='weight',
+                  train_size=0.65, random_state=42) :
+    # signal (class 1) and background (class 0) samples -> arrays and a stratified split
+    if not isinstance(backgrounds, (list, tuple)) :
+        backgrounds = [backgrounds]
+    samples = [signal] + list(backgrounds)
+
+    X = np.concatenate([np.column_stack([np.asarray(sample[f], dtype=float) for f in features])
+                        for sample in samples])
+    w = np.concatenate([np.asarray(sample[weight], dtype=float) for sample in samples])
+    values = np.concatenate([np.asarray(sample[column], dtype=float) for sample in samples])
+    y = np.concatenate([np.ones(len(signal), dtype=int)] + [np.zeros(len(b), dtype=int) for b in backgrounds])
+
+    train, test = train_test_split(np.arange(len(y)), stratify=y, random_state=random_state,
+                                   train_size=train_size, test_size=1.-train_size)
+
+    sha = hashlib.sha1()
+    for array in [X, y, w, values, train] :
+        sha.update(np.ascontiguousarray(array).tobytes())
+    sha.update(json.dumps(list(features)).encode())
+
+    return {'X': X, 'y': y, 'w': w, 'values': values,
+            'train': np.sort(train), 'test': np.sort(test),
+            'train_size': train_size,
+            'features': list(features),
+            'hash': sha.hexdigest()}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LeaveOneOut (features) :
+    # all features plus every subset with one feature removed
+    feature_sets = {'all': list(features)}
+    for f in features :
+        feature_sets['no_'+f] = [g for g in features if g != f]
+    return feature_sets
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ScanTasks (grid, feature_sets, dataset_hash, output_dir, binning) :
+    # one task per model x hyperparameters (without n_estimators for boosting) x feature set
+    tasks = []
+    for model_name in sorted(grid) :
+        params = dict(grid[model_name])
+        staged = None
+        if model_name == 'GradientBoosting' :
+            staged = sorted(params.pop('n_estimators', [100]))
+        keys = sorted(params)
+        for values in itertools.product(*[params[k] for k in keys]) :
+            for set_name in sorted(feature_sets) :
+                tasks.append({'model': model_name,
+                              'params': dict(zip(keys, values)),
+                              'staged': staged,
+                              'feature_set': set_name,
+                              'features': list(feature_sets[set_name]),
+                              'dataset': dataset_hash,
+                              'output_dir': output_dir,
+                              'binning': binning})
+    return tasks
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ResultKey (task, n_estimators=None) :
+
+    key = {'model': task['model'], 'params': task['params'], 'features': task['features'],
+           'dataset': task['dataset'], 'n_estimators': n_estimators, 'binning': list(task['binning'])}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def WeightedScore (y, predicted, w) :
+    # weighted accuracy, as classifier.score(X, y, sample_weight=w)
+    return np.sum(w*(predicted == y))/np.sum(w)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ExpectedCLs (scores, dataset, binning, N_thresholds=100) :
+    # best expected CLs over cuts score > threshold, test sample scaled to the full luminosity
+    test = dataset['test']
+    y = dataset['y'][test]
+    w = dataset['w'][test]/(1.-dataset['train_size'])
+    values = dataset['values'][test]
+
+    thresholds = np.unique(np.percentile(scores[y == 1], np.linspace(0., 99., N_thresholds)))
+    s = cutscan.CumulativeHistograms(scores[y == 1], values[y == 1], w[y == 1], binning, thresholds)
+    b = cutscan.CumulativeHistograms(scores[y == 0], values[y == 0], w[y == 0], binning, thresholds)
+    CLs = stat.AsimovSensitivity(b, s)['CLs']
+    best = np.nanargmin(CLs)
+    return CLs[best], thresholds[best]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Truncated (model, n_estimators) :
+    # boosting model with only the first n_estimators stages
+    model = cPickle.loads(cPickle.dumps(model, -1))
+    model.estimators_ = model.estimators_[:n_estimators]
+    model.train_score_ = model.train_score_[:n_estimators]
+    if hasattr(model, 'oob_improvement_') :
+        model.oob_improvement_ = model.oob_improvement_[:n_estimators]
+    model.n_estimators = n_estimators
+    model.n_estimators_ = n_estimators
+    return model
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SaveResult (task, model, result, n_estimators=None) :
+
+    key = ResultKey(task, n_estimators)
+    path = os.path.join(task['output_dir'], key)
+    with open(path+'.pkl', 'wb') as fid :
+        cPickle.dump(model, fid, -1)
+    result['path'] = path+'.pkl'
+    with open(path+'.json', 'w') as f :
+        json.dump(result, f, indent=1, sort_keys=True)
+    return result
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LoadResult (task, n_estimators=None) :
+
+    path = os.path.join(task['output_dir'], ResultKey(task, n_estimators))
+    if os.path.exists(path+'.json') and os.path.exists(path+'.pkl') :
+        with open(path+'.json') as f :
+            return json.load(f)
+    return None
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def FitTask (task) :
+    # train one combination on the shared DATASET; returns one result per n_estimators
+    stages = task['staged'] or [None]
+    cached = [LoadResult(task, n) for n in stages]
+    if all(result is not None for result in cached) :
+        return cached
+
+    dataset = DATASET
+    columns = [dataset['features'].index(f) for f in task['features']]
+    train = dataset['train']
+    test = dataset['test']
+    X_test = dataset['X'][test][:,columns]
+    y_test = dataset['y'][test]
+    w_test = dataset['w'][test]
+
+    params = dict(task['params'])
+    if task['staged'] :
+        params['n_estimators'] = stages[-1]
+    model = MODELS[task['model']](**params)
+    model.fit(dataset['X'][train][:,columns], dataset['y'][train], sample_weight=dataset['w'][train])
+
+    if task['staged'] :
+        decisions = [(n, d) for n,d in enumerate(model.staged_decision_function(X_test), 1) if n in stages]
+    else :
+        decisions = [(None, model.decision_function(X_test))]
+
+    results = []
+    for n, decision in decisions :
+        decision = np.asarray(decision, dtype=float).ravel()
+        CLs, threshold = ExpectedCLs(decision, dataset, task['binning'])
+        result = {'model': task['model'],
+                  'params': dict(task['params'], **({'n_estimators': n} if n else {})),
+                  'feature_set': task['feature_set'],
+                  'features': task['features'],
+                  'N_features': len(task['features']),
+                  'test_score': WeightedScore(y_test, (decision > 0).astype(int), w_test),
+                  'CLs': float(CLs),
+                  'threshold': float(threshold)}
+        results.append(SaveResult(task, Truncated(model, n) if n else model, result, n))
+    return results
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def MVAScan (dataset, grid, feature_sets=None, output_dir=SCAN_DIR, processes=None,
+             binning=np.linspace(50,130,28), progress=None) :
+    # DataFrame with one row per trained model, best expected CLs first
+    global DATASET
+    if feature_sets is None :
+        feature_sets = {'all': dataset['features']}
+    if not os.path.isdir(output_dir) :
+        os.makedirs(output_dir)
+
+    # set before the pool is created, the workers share it
+    DATASET = dataset
+    tasks = ScanTasks(grid, feature_sets, dataset['hash'], output_dir, list(binning))
+
+    rows = []
+    for results in parallel.MapTasks(FitTask, tasks, processes, progress) :
+        for result in results :
+            row = dict(result)
+            row['params'] = json.dumps(result['params'], sort_keys=True)
+            rows.append(row)
+
+    columns = ['model', 'params', 'feature_set', 'features', 'N_features', 'test_score', 'CLs', 'threshold', 'path']
+    return pd.DataFrame(rows, columns=columns).sort_values('CLs').reset_index(drop=True)
+#-------------------------------------------------------------------------------------------
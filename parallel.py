@@ -0,0 +1,111 @@
+import numpy as np
+import itertools
+import multiprocessing
+import stats as stat
+import stats_2D as stat2D
+import streaming
+
+"""
+Pseudo-experiments for several hypotheses (e.g. m_H = 85, 90, 95) on a process pool.
+Every (hypothesis, chunk) pair gets its own RandomState seeded with [seed, hypothesis, chunk],
+and the chunks are merged in order. The toys for a given seed and chunk_size are therefore
+identical whatever the number of workers.
+"""
+
+#-------------------------------------------------------------------------------------------
+def ToyTasks (templates, N_experiments, chunk_size=100000, seed=0, bin_width=None) :
+    # one task per (hypothesis, chunk)
+    if np.ndim(N_experiments) == 0 :
+        N_experiments = [N_experiments]*len(templates)
+
+    tasks = []
+    for h,template in enumerate(templates) :
+        for c,n in enumerate(stat.ChunkSizes(N_experiments[h], chunk_size)) :
+            tasks.append((h, c, template, n, seed, bin_width))
+    return tasks
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ToyChunk (task) :
+
+    h, c, template, n, seed, bin_width = task
+    random_state = np.random.RandomState([seed, h, c])
+    llr_b_like, llr_sPlusb_like, N_divByZero = stat2D.LogLikRatioChunk(template, n, random_state)
+
+    # with a bin width only the (small) accumulators travel back from the worker
+    if bin_width is not None :
+        llr_b_like = streaming.FillAccumulator(streaming.NewAccumulator(bin_width), llr_b_like)
+        llr_sPlusb_like = streaming.FillAccumulator(streaming.NewAccumulator(bin_width), llr_sPlusb_like)
+
+    return h, llr_b_like, llr_sPlusb_like, N_divByZero
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def MapTasks (function, tasks, processes=None, progress=None) :
+    # ordered map over tasks, in-process for processes=1
+    # progress(N_done, N_total) is called after every finished task
+    if processes == 1 :
+        pool = None
+        results = itertools.imap(function, tasks)
+    else :
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(function, tasks)
+
+    try :
+        for k,result in enumerate(results) :
+            if progress is not None :
+                progress(k+1, len(tasks))
+            yield result
+    finally :
+        if pool is not None :
+            pool.terminate()
+            pool.join()
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioPool (backgrounds, signals, N_experiments=10000, chunk_size=100000, seed=0,
+                     processes=None, progress=None, emptyCalc=False, bin_width=None, return_counts=False) :
+    # bin_width given -> (acc_b, acc_sPlusb) streaming accumulators instead of toy arrays
+    # emptyCalc prints the bin counts, return_counts appends them to the result
+
+    templates = [stat2D.LogLikRatioTemplate(b, s) for b,s in zip(backgrounds, signals)]
+    tasks = ToyTasks(templates, N_experiments, chunk_size, seed, bin_width)
+
+    llr_b_like = [[] for template in templates]
+    llr_sPlusb_like = [[] for template in templates]
+    N_divByZero = [0 for template in templates]
+
+    for h, b_like, sPlusb_like, divByZero in MapTasks(ToyChunk, tasks, processes, progress) :
+        llr_b_like[h].append(b_like)
+        llr_sPlusb_like[h].append(sPlusb_like)
+        N_divByZero[h] += divByZero
+
+    if bin_width is not None :
+        arrays = [(streaming.MergeAccumulators(llr_b_like[h] or [streaming.NewAccumulator(bin_width)]),
+                   streaming.MergeAccumulators(llr_sPlusb_like[h] or [streaming.NewAccumulator(bin_width)]))
+                  for h in xrange(len(templates))]
+    else :
+        arrays = [(np.concatenate(llr_b_like[h]+[[]]), np.concatenate(llr_sPlusb_like[h]+[[]]))
+                  for h in xrange(len(templates))]
+
+    counts = [{'N_bins': template['N_bins'],
+               'N_emptyBins': template['N_emptyBins'],
+               'N_divByZero': N_divByZero[h]} for h,template in enumerate(templates)]
+    if emptyCalc == True:
+        for c in counts :
+            stat2D.PrintCounts(c)
+    if return_counts == True:
+        return arrays, counts
+    return arrays
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def PrintProgress (N_done, N_total) :
+    # simple progress callback for the notebooks
+    if N_done == N_total or N_done % max(1, N_total//20) == 0 :
+        print "%i / %i toy chunks done" %(N_done, N_total)
+#-------------------------------------------------------------------------------------------
@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+import selection as sel
+import scoring
+import parallel
+
+"""
+Out-of-core event pipeline.
+Every sample is read in chunks of chunk_size events; per chunk the cross-section weight is set,
+the classifier scores are computed, the selection cuts of every mass hypothesis are applied
+(cuts shared between hypotheses are evaluated once per chunk) and the selected events are
+filled into weighted histograms (sum of weights and sum of weights squared). Only the needed
+columns are read and no sample is ever held in memory as a whole, so the peak memory is set by
+chunk_size. The files are processed in parallel with parallel.MapTasks.
+
+    hypotheses = [pp.Hypothesis(mH, 'mmis', np.linspace(50,130,28),
+                                sel.SelectionCuts(mH) + sel.BDTCut(mH, cut))
+                  for mH, cut in zip([85,90,95], [-3.15,-2.9,-2.9])]
+    samples = dict((name, 'data/higgs_%s.csv' %name) for name in pp.BACKGROUNDS)
+    histos = pp.StreamSamples(samples, hypotheses, classifiers, processes=4)
+    bkg_histos = [sumw for sumw, sumw2 in pp.SumSamples(histos, pp.BACKGROUNDS)]
+
+transform is an optional module level function chunk -> chunk (e.g. to add a composed variable),
+applied after the scoring. The columns it creates are not in the files and have to be listed in
+transform_columns; the columns it reads are added to columns, e.g.
+    created = ['composed_85', 'composed_90', 'composed_95']
+    columns = pp.NeededColumns(hypotheses2D, classifiers, transform_columns=created) | set(variables)
+    histos = pp.StreamSamples(samples, hypotheses2D, classifiers, transform=AddComposed, columns=columns)
+"""
+
+LUMINOSITY = 176.773
+
+# sample -> (cross section in pb, number of generated events)
+CROSS_SECTIONS = {'qq': (102., 200000.),
+                  'ww': (16.5, 294500.),
+                  'zz': (0.975, 196000.),
+                  'zee': (3.35, 29500.),
+                  'wen': (2.9, 81786.),
+                  'eeqq': (15600., 5940000.),
+                  'higgs_85': (0.094, 3972.),
+                  'higgs_90': (0.0667, 3973.),
+                  'higgs_95': (0.0333, 3971.)}
+
+BACKGROUNDS = ['qq', 'ww', 'zz', 'zee', 'wen', 'eeqq']
+
+
+#-------------------------------------------------------------------------------------------
+def SampleWeight (name, luminosity=LUMINOSITY) :
+    # L * sigma / N for simulation, 1 for data
+    if name not in CROSS_SECTIONS :
+        return 1.
+    cross_section, N_generated = CROSS_SECTIONS[name]
+    return luminosity*cross_section/N_generated
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Hypothesis (name, column, binning, cuts) :
+    # column and binning are a name and edges (1D) or pairs of them (2D)
+    return {'name': name,
+            'column': column,
+            'binning': binning,
+            'cuts': cuts}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CutColumns (cut) :
+
+    if cut[0] in ['or', 'and'] :
+        return set().union(*[CutColumns(subcut) for subcut in cut[1:]])
+    return set([cut[0]])
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def NeededColumns (hypotheses, classifiers=None, features=scoring.FEATURES, transform_columns=()) :
+    # columns to read from the files; the score and transform columns are computed, not read
+    columns = set()
+    for hypothesis in hypotheses :
+        for label, cut in hypothesis['cuts'] :
+            columns |= CutColumns(cut)
+        column = hypothesis['column']
+        columns |= set([column] if isinstance(column, basestring) else column)
+
+    columns -= set(transform_columns)
+    if classifiers :
+        columns -= set(classifiers)
+        columns |= set(features)
+    return columns
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def FillChunk (histograms, hypotheses, chunk) :
+    # add the selected events of one chunk to the histograms of every hypothesis
+    cache = {}
+    weights = np.asarray(chunk['weight'], dtype=float)
+    for hist, hypothesis in zip(histograms, hypotheses) :
+        mask = sel.SelectionMask(chunk, hypothesis['cuts'], cache)
+        w = weights[mask]
+        column = hypothesis['column']
+        if isinstance(column, basestring) :
+            x = np.asarray(chunk[column])[mask]
+            hist['sumw'] += np.histogram(x, bins=hypothesis['binning'], weights=w)[0]
+            hist['sumw2'] += np.histogram(x, bins=hypothesis['binning'], weights=w**2)[0]
+        else :
+            x = np.asarray(chunk[column[0]])[mask]
+            y = np.asarray(chunk[column[1]])[mask]
+            hist['sumw'] += np.histogram2d(x, y, bins=hypothesis['binning'], weights=w)[0]
+            hist['sumw2'] += np.histogram2d(x, y, bins=hypothesis['binning'], weights=w**2)[0]
+        hist['N_events'] += np.count_nonzero(mask)
+    return histograms
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def NewHistograms (hypotheses) :
+
+    histograms = []
+    for hypothesis in hypotheses :
+        if isinstance(hypothesis['column'], basestring) :
+            shape = (len(hypothesis['binning'])-1,)
+        else :
+            shape = tuple(len(edges)-1 for edges in hypothesis['binning'])
+        histograms.append({'sumw': np.zeros(shape), 'sumw2': np.zeros(shape), 'N_events': 0})
+    return histograms
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ProcessFile (task) :
+    # one sample, chunk by chunk
+    path, weight, hypotheses, classifiers, features, columns, chunk_size, transform = task
+    histograms = NewHistograms(hypotheses)
+    models = [(column, scoring.LoadModel(classifiers[column])) for column in sorted(classifiers or {})]
+
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size) :
+        chunk['weight'] = weight
+        if models :
+            X = chunk[features].values.astype(float)
+            for column, model in models :
+                chunk[column] = model.decision_function(X)
+        if transform is not None :
+            chunk = transform(chunk)
+        FillChunk(histograms, hypotheses, chunk)
+
+    return histograms
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def StreamSamples (samples, hypotheses, classifiers=None, features=scoring.FEATURES, chunk_size=100000,
+                   processes=None, luminosity=LUMINOSITY, transform=None, columns=None, progress=None,
+                   transform_columns=()) :
+    # samples: dict name -> csv path; returns dict name -> one histogram dict per hypothesis
+    # columns: read these columns (default: NeededColumns, add the ones transform needs)
+    # transform_columns: columns created by transform, never read from the files
+    if columns is None :
+        columns = NeededColumns(hypotheses, classifiers, features, transform_columns)
+    columns = sorted(str(column) for column in columns)
+
+    names = sorted(samples)
+    tasks = [(samples[name], SampleWeight(name, luminosity), hypotheses, classifiers, features, columns,
+              chunk_size, transform) for name in names]
+
+    results = {}
+    for name, result in zip(names, parallel.MapTasks(ProcessFile, tasks, processes, progress)) :
+        results[name] = result
+    return results
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SumSamples (results, names) :
+    # (sumw, sumw2) per hypothesis summed over the samples names, e.g. all backgrounds
+    summed = []
+    for h in xrange(len(results[names[0]])) :
+        sumw = sum(results[name][h]['sumw'] for name in names)
+        sumw2 = sum(results[name][h]['sumw2'] for name in names)
+        summed.append((sumw, sumw2))
+    return summed
+#-------------------------------------------------------------------------------------------
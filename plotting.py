@@ -5,7 +5,7 @@ from scipy import stats
 import stats as stat
 
 #-------------------------------------------------------------------------------------------
-def BkgSigHistos (background, signals, data, variable_binning,x_label,savepath=None) :
+def BkgSigHistos (background, signals, data, variable_binning,x_label,savepath=None,m_H=[85,90,95]) :
     
     bkg = background
     sigModels = signals
@@ -15,13 +15,11 @@ def BkgSigHistos (background, signals, data, variable_binning,x_label,savepath=N
     
     binw = binning[1]-binning[0]
     #binw = np.array([10,10,10,5,5,5,5,5,5,10,20])
-    fig, axs = plt.subplots(nrows=3, ncols=1, sharex=True,figsize=(8,10))
-
-    m_H = [85,90,95]
+    fig, axs = plt.subplots(nrows=len(m_H), ncols=1, sharex=True,figsize=(8,10*len(m_H)/3.),squeeze=False)
     
-    for i in xrange(3) :
+    for i in xrange(len(m_H)) :
 
-        ax = axs[i]
+        ax = axs[i,0]
 
         ax.bar(binning[:-1]+binw/2.,bkg[i],width=binw,label='background',color='yellow',edgecolor='k',linewidth=0.1)
 
@@ -32,7 +30,7 @@ def BkgSigHistos (background, signals, data, variable_binning,x_label,savepath=N
                     fmt='o', color='k',label='data',linewidth=1)
         ax.legend(fontsize=14)
         ax.set_ylabel('Events / '+ str(round(binw,1))+' '+x_unit,fontsize=14)
-        if (i == 2) :
+        if (i == len(m_H)-1) :
             ax.set_xlabel(x_name+' ['+x_unit+']',fontsize=14)
         plt.tight_layout()
 
@@ -49,40 +47,24 @@ def BkgSigHistos (background, signals, data, variable_binning,x_label,savepath=N
         
         
 #-------------------------------------------------------------------------------------------
-def LogLikRatioPlots(arrays,obs,Nbins=30,savepath=None) :
+def LogLikRatioPlots(arrays,obs,Nbins=30,savepath=None,m_H=[85,90,95]) :
  
     
-    fig, axs = plt.subplots(nrows=3, ncols=1,figsize=(8,10))
-    m_H = [85,90,95]
+    fig, axs = plt.subplots(nrows=len(m_H), ncols=1,figsize=(8,10*len(m_H)/3.),squeeze=False)
 
-    CLlist = []
-    
-    QuantileList_b = []
-    QuantileList_sPlusb = []
+    # the CLs and quantiles do not depend on the plot binning
+    CLlist, QuantileList_b, QuantileList_sPlusb = stat.GetCLList(arrays,obs)
     
     
-    for i in xrange(3) :
-        ax = axs[i]
+    for i in xrange(len(m_H)) :
+        ax = axs[i,0]
 
-        llr_b, llr_sPlusb = arrays[i]
-        norm = len(llr_b)
-        binning = np.linspace(np.minimum(llr_b,llr_sPlusb).min(),np.maximum(llr_b,llr_sPlusb).max(),Nbins)
+        (llr_b, w_b), (llr_sPlusb, w_sPlusb) = stat.LLRDistribution(arrays[i])
+        binning = np.linspace(min(llr_b.min(),llr_sPlusb.min()),max(llr_b.max(),llr_sPlusb.max()),Nbins)
         width = binning[1]-binning[0]
  
-        
-        llr_b_hist = 1.*np.histogram(llr_b,bins=binning)[0]/norm
-        QuantileList_b.append(stat.GetQuantiles(llr_b_hist,binning)) 
-        
-        
-        pos =  np.where(binning <= obs[i])[0][-1]
-        print pos
-        OneMinusCLb =  sum(llr_b_hist[:pos]) 
-        
-        llr_sPlusb_hist = 1.*np.histogram(llr_sPlusb,bins=binning)[0]/norm
-        QuantileList_sPlusb.append(stat.GetQuantiles(llr_sPlusb_hist,binning)) 
-        
-        CLsPlusb =  sum(llr_sPlusb_hist[pos:])
-        CLlist.append([OneMinusCLb, CLsPlusb])
+        llr_b_hist = np.histogram(llr_b,bins=binning,weights=w_b)[0]
+        llr_sPlusb_hist = np.histogram(llr_sPlusb,bins=binning,weights=w_sPlusb)[0]
        
         ax.step(x=binning[:-1],y=llr_b_hist,color='blue',label='bkg-like')
         ax.step(x=binning[:-1],y=llr_sPlusb_hist,color='red',label='sig+bkg-like')
@@ -113,4 +95,32 @@ def LogLikRatioPlots(arrays,obs,Nbins=30,savepath=None) :
     
     
     return CLlist, QuantileList_b, QuantileList_sPlusb
-#-------------------------------------------------------------------------------------------
\ No newline at end of file
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CLsScanPlot (scan, savepath=None) :
+    # observed and expected CLs of masscan.MassScan over the mass grid
+    masses = scan['masses']
+    if masses is None :
+        masses = np.arange(len(scan['CLs_obs']))
+
+    plt.figure(figsize=(9,6))
+    plt.fill_between(masses, scan['CLs_twoSigma'][:,0], scan['CLs_twoSigma'][:,1], facecolor='yellow', label=r'expected $\pm 2\sigma$')
+    plt.fill_between(masses, scan['CLs_oneSigma'][:,0], scan['CLs_oneSigma'][:,1], facecolor='lawngreen', label=r'expected $\pm 1\sigma$')
+    plt.plot(masses, scan['CLs_median'], 'b--', label='expected bkg', linewidth=3)
+    plt.plot(masses, scan['CLs_obs'], 'r-', label='observed', linewidth=3)
+    plt.hlines(0.05, min(masses), max(masses), color='k', linewidth=1)
+    plt.text(max(masses), 0.05, '95% CL', fontsize=14)
+
+    plt.semilogy()
+    plt.xlim(min(masses), max(masses))
+    plt.xlabel(r'$m_{H}$ [GeV]', fontsize=14)
+    plt.ylabel(r'CL${}_\mathrm{s}$', fontsize=14)
+    plt.legend(fontsize=14, loc='best')
+    
+    if (savepath != None) :
+        plt.savefig(savepath)
+    else :
+        plt.show()
+#-------------------------------------------------------------------------------------------
@@ -6,7 +6,7 @@ import stats as stat
 
 
 #-------------------------------------------------------------------------------------------
-def BkgSigHistos (backgrounds, signals, datas, variable_binning,x_label,savepath=None) :
+def BkgSigHistos (backgrounds, signals, datas, variable_binning,x_label,savepath=None,m_H=[85,90,95]) :
     
     bkg = backgrounds
     sigModels = signals
@@ -15,14 +15,12 @@ def BkgSigHistos (backgrounds, signals, datas, variable_binning,x_label,savepath
     data_hist = datas
     
  
-    fig, axs = plt.subplots(nrows=3, ncols=1, sharex=True,figsize=(8,10))
+    fig, axs = plt.subplots(nrows=len(m_H), ncols=1, sharex=True,figsize=(8,10*len(m_H)/3.),squeeze=False)
 
-    m_H = [85,90,95]
-
-    for i in xrange(3) :
+    for i in xrange(len(m_H)) :
         binw = binning[i][1:]-binning[i][:-1]
         #binw = np.array([30,5,5,5,5,5,5,30])
-        ax = axs[i]
+        ax = axs[i,0]
 
         ax.bar(binning[i][:-1]+binw/2.,bkg[i],width=binw,label='background',color='yellow',edgecolor='k',linewidth=0.1)
 
@@ -40,7 +38,7 @@ def BkgSigHistos (backgrounds, signals, datas, variable_binning,x_label,savepath
         ax.legend(fontsize=14)
         ax.set_ylabel('Events / '+ str(round(binw[0],1))+' '+x_unit, fontsize=14)
 
-    if (i == 2) :
+    if (i == len(m_H)-1) :
         ax.set_xlabel(x_name+' ['+x_unit+']', fontsize=14)
         plt.tight_layout()
 
@@ -49,44 +47,28 @@ def BkgSigHistos (backgrounds, signals, datas, variable_binning,x_label,savepath
     if (savepath != None) :
         #plt.savefig('plots/test')
         plt.savefig(savepath)
-    plt.show()
+    else :
+        plt.show()
 #-------------------------------------------------------------------------------------------
 
         
 #-------------------------------------------------------------------------------------------
-def LogLikRatioPlots(arrays,obs,Nbins=30,savepath=None) :
+def LogLikRatioPlots(arrays,obs,Nbins=30,savepath=None,m_H=[85,90,95]) :
  
     
-    fig, axs = plt.subplots(nrows=3, ncols=1,figsize=(8,10))
-    m_H = [85,90,95]
-    QuantileList_b = []
-    QuantileList_sPlusb = []
-
-    CLlist = []
-    for i in xrange(3) :
-        ax = axs[i]
-
-        llr_b, llr_sPlusb = arrays[i]
-        norm = len(llr_b)
-        binning = np.linspace(np.minimum(llr_b,llr_sPlusb).min(),np.maximum(llr_b,llr_sPlusb).max(),Nbins)
-        
-        #print np.minimum(llr_b,llr_sPlusb).min()
-        #print norm
-        #print binning
-        
-        llr_b_hist = 1.*np.histogram(llr_b,bins=binning)[0]/norm
-        QuantileList_b.append(stat.GetQuantiles(llr_b_hist,binning))
-        if min(binning)<obs[i]:
-            pos =  np.where(binning <= obs[i])[0][-1]
-        else:
-            pos = 0
-            print "Higgs-Model %i: llr changed from %f to %f to fit into plot" %(m_H[i],obs[i],min(binning)) 
-        OneMinusCLb =  sum(llr_b_hist[:pos]) 
-        llr_sPlusb_hist = 1.*np.histogram(llr_sPlusb,bins=binning)[0]/norm
-        QuantileList_sPlusb.append(stat.GetQuantiles(llr_sPlusb_hist,binning))
+    fig, axs = plt.subplots(nrows=len(m_H), ncols=1,figsize=(8,10*len(m_H)/3.),squeeze=False)
+
+    # the CLs and quantiles do not depend on the plot binning
+    CLlist, QuantileList_b, QuantileList_sPlusb = stat.GetCLList(arrays,obs)
+
+    for i in xrange(len(m_H)) :
+        ax = axs[i,0]
+
+        (llr_b, w_b), (llr_sPlusb, w_sPlusb) = stat.LLRDistribution(arrays[i])
+        binning = np.linspace(min(llr_b.min(),llr_sPlusb.min()),max(llr_b.max(),llr_sPlusb.max()),Nbins)
         
-        CLsPlusb =  sum(llr_sPlusb_hist[pos:])
-        CLlist.append([OneMinusCLb, CLsPlusb])
+        llr_b_hist = np.histogram(llr_b,bins=binning,weights=w_b)[0]
+        llr_sPlusb_hist = np.histogram(llr_sPlusb,bins=binning,weights=w_sPlusb)[0]
        
         ax.step(x=binning[:-1],y=llr_b_hist,color='blue',label='bkg-like')
         ax.step(x=binning[:-1],y=llr_sPlusb_hist,color='red',label='sig+bkg-like')
@@ -110,7 +92,8 @@ def LogLikRatioPlots(arrays,obs,Nbins=30,savepath=None) :
     if (savepath != None) :
         #plt.savefig('plots/test')
         plt.savefig(savepath)
-    plt.show()      
+    else :
+        plt.show()      
     
     return CLlist, QuantileList_b, QuantileList_sPlusb
 #-------------------------------------------------------------------------------------------
@@ -118,10 +101,9 @@ def LogLikRatioPlots(arrays,obs,Nbins=30,savepath=None) :
 
 fs=12
 #-------------------------------------------------------------------------------------------
-def TwoDHist(var1, var2, framesMC_HiggsModels, NoHiggs, data, framesMC_HiggsModelsNames, savepath=None, bins=(40,40)) :
+def TwoDHist(var1, var2, framesMC_HiggsModels, NoHiggs, data, framesMC_HiggsModelsNames, savepath=None, bins=(40,40), m_H=[85,90,95]) :
     
     # does not work for composed variable
-    m_H = [85,90,95]
     for i,df in enumerate(framesMC_HiggsModels) :
         #dataframe = SelectionCut(dataframe=df) # remember to comment this in/out in both loops!
         if var2 == 'composed':
@@ -143,7 +125,9 @@ def TwoDHist(var1, var2, framesMC_HiggsModels, NoHiggs, data, framesMC_HiggsMode
         plt.tight_layout()
         if savepath != None:
             plt.savefig(savepath+var1+var_2+framesMC_HiggsModelsNames[i])
-        plt.show()
+            plt.close()
+        else :
+            plt.show()
 
     for j,df in enumerate([NoHiggs]):#(framesMC_NoHiggs) :
         #dataframe = SelectionCut(dataframe=df) # remember to comment this in/out in both loops!
@@ -164,7 +148,9 @@ def TwoDHist(var1, var2, framesMC_HiggsModels, NoHiggs, data, framesMC_HiggsMode
         plt.tight_layout()
         if savepath != None:
             plt.savefig(savepath+var1+var_2+'background')
-        plt.show()
+            plt.close()
+        else :
+            plt.show()
 
     for i,df in enumerate([data]):#(framesMC_NoHiggs) :
         #dataframe = SelectionCut(dataframe=df) # remember to comment this in/out in both loops!
@@ -184,14 +170,15 @@ def TwoDHist(var1, var2, framesMC_HiggsModels, NoHiggs, data, framesMC_HiggsMode
         plt.tight_layout()
         if savepath != None:
             plt.savefig(savepath+var1+var_2+'data')
-        plt.show()
+            plt.close()
+        else :
+            plt.show()
 #-------------------------------------------------------------------------------------------
 
 
 
 #-------------------------------------------------------------------------------------------
-def TwoDHistFull(var1, var2, framesMC_HiggsModels, frames_NoHiggs, frames_data, framesMC_HiggsModelsNames, savepath=None, bins=(40,40)) :
-    m_H = [85,90,95]
+def TwoDHistFull(var1, var2, framesMC_HiggsModels, frames_NoHiggs, frames_data, framesMC_HiggsModelsNames, savepath=None, bins=(40,40), m_H=[85,90,95]) :
     for i,df in enumerate(framesMC_HiggsModels) :
         #dataframe = SelectionCut(dataframe=df) # remember to comment this in/out in both loops!
         if var2 == 'composed':
@@ -213,7 +200,9 @@ def TwoDHistFull(var1, var2, framesMC_HiggsModels, frames_NoHiggs, frames_data,
         plt.tight_layout()
         if savepath != None:
             plt.savefig(savepath+var1+var_2+framesMC_HiggsModelsNames[i])
-        plt.show()
+            plt.close()
+        else :
+            plt.show()
 
         dataframe = frames_NoHiggs[i]
         plt.title ('background_'+str(m_H[i]),fontsize=fs+2)
@@ -228,7 +217,9 @@ def TwoDHistFull(var1, var2, framesMC_HiggsModels, frames_NoHiggs, frames_data,
         plt.tight_layout()
         if savepath != None:
             plt.savefig(savepath+var1+var_2+'background')
-        plt.show()
+            plt.close()
+        else :
+            plt.show()
 
         dataframe = frames_data[i]
         plt.title('data_'+str(m_H[i]),fontsize=fs+2)
@@ -243,5 +234,7 @@ def TwoDHistFull(var1, var2, framesMC_HiggsModels, frames_NoHiggs, frames_data,
         plt.tight_layout()
         if savepath != None:
             plt.savefig(savepath+var1+var_2+'data')
-        plt.show()
+            plt.close()
+        else :
+            plt.show()
 #-------------------------------------------------------------------------------------------
\ No newline at end of file
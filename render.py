@@ -0,0 +1,234 @@
+import numpy as np
+import os
+import json
+import hashlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import stats as stat
+import parallel
+
+"""
+Headless figure rendering.
+Figures are described by small specs built from precomputed histograms (no DataFrames, no
+pyplot state), drawn on explicit Agg figures and written to a target directory, optionally on a
+process pool. A hash of every spec is kept in the target directory, figures whose inputs did not
+change are skipped.
+
+    specs = [rd.StackFigure('mmis_%i' %mH, bkg_histos[i], sig_histos[i], data_histos[i],
+                            binning, ('mmis', 'GeV'), mH) for i,mH in enumerate([85,90,95])]
+    specs += [rd.Hist2DFigure('bkg2D_%i' %mH, sumw, (edges1, edges2), 'background_%i' %mH, 'mmis', 'composed')]
+    specs += [rd.LogLikRatioFigure('llr_%i' %mH, llr_85, llr_obs[0], m_H=mH)]
+    rd.RenderFigures(specs, 'plots/scan_0', processes=4)
+"""
+
+# bump whenever the drawing changes, all figures are then rendered again
+RENDER_VERSION = 1
+MANIFEST = '.render_hashes.json'
+fs = 12
+
+
+#-------------------------------------------------------------------------------------------
+def StackFigure (name, background, signal, data, binning, x_label, m_H) :
+    # one panel of plotting.BkgSigHistos
+    return {'kind': 'stack', 'name': name,
+            'background': np.asarray(background, dtype=float),
+            'signal': np.asarray(signal, dtype=float),
+            'data': np.asarray(data, dtype=float),
+            'binning': np.asarray(binning, dtype=float),
+            'x_label': tuple(x_label),
+            'm_H': m_H}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioFigure (name, entry, obs, Nbins=30, m_H=85) :
+    # one panel of plotting.LogLikRatioPlots; the toys are histogrammed here, the spec stays small
+    (llr_b, w_b), (llr_sPlusb, w_sPlusb) = stat.LLRDistribution(entry)
+    binning = np.linspace(min(llr_b.min(),llr_sPlusb.min()),max(llr_b.max(),llr_sPlusb.max()),Nbins)
+    return {'kind': 'llr', 'name': name,
+            'binning': binning,
+            'hist_b': np.histogram(llr_b,bins=binning,weights=w_b)[0],
+            'hist_sPlusb': np.histogram(llr_sPlusb,bins=binning,weights=w_sPlusb)[0],
+            'obs': float(obs),
+            'm_H': m_H}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Hist2DFigure (name, hist, edges, title, x_label, y_label) :
+    # precomputed 2D histogram, e.g. from histindex.Histogram2D or pipeline
+    return {'kind': 'hist2d', 'name': name,
+            'hist': np.asarray(hist, dtype=float),
+            'edges': (np.asarray(edges[0], dtype=float), np.asarray(edges[1], dtype=float)),
+            'title': title,
+            'x_label': x_label,
+            'y_label': y_label}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CLsScanFigure (name, scan) :
+    # masscan.MassScan result as in plotting.CLsScanPlot
+    masses = scan['masses']
+    if masses is None :
+        masses = np.arange(len(scan['CLs_obs']))
+    spec = {'kind': 'cls_scan', 'name': name, 'masses': np.asarray(masses, dtype=float)}
+    for key in ['CLs_obs', 'CLs_median', 'CLs_oneSigma', 'CLs_twoSigma'] :
+        spec[key] = np.asarray(scan[key], dtype=float)
+    return spec
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def DrawStack (ax, spec) :
+
+    binning = spec['binning']
+    binw = binning[1:]-binning[:-1]
+    x_name, x_unit = spec['x_label']
+    centers = binning[:-1]+binw/2.
+
+    ax.bar(centers,spec['background'],width=binw,label='background',color='yellow',edgecolor='k',linewidth=0.1)
+    ax.bar(centers,spec['signal'],width=binw,linewidth=0.1,
+           label=r'H signal ($m_\mathrm{H}= $'+str(spec['m_H'])+' GeV)',color='red',bottom=spec['background'],edgecolor='k')
+    ax.errorbar(x=centers,y=spec['data'], xerr=binw/2., yerr=np.sqrt(spec['data']),
+                fmt='o', color='k',label='data',linewidth=1)
+    ax.legend(fontsize=14)
+    ax.set_ylabel('Events / '+ str(round(binw[0],1))+' '+x_unit,fontsize=14)
+    ax.set_xlabel(x_name+' ['+x_unit+']',fontsize=14)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def DrawLogLikRatio (ax, spec) :
+
+    binning = spec['binning']
+    llr_b_hist = spec['hist_b']
+    llr_sPlusb_hist = spec['hist_sPlusb']
+    obs = spec['obs']
+    width = binning[1]-binning[0]
+
+    ax.step(x=binning[:-1],y=llr_b_hist,color='blue',label='bkg-like')
+    ax.step(x=binning[:-1],y=llr_sPlusb_hist,color='red',label='sig+bkg-like')
+
+    x1 = binning[binning<=obs]
+    x2 = binning[binning>obs]
+    ax.bar(x2[:-1]-width/2., llr_sPlusb_hist[-len(x2)+1:], width=width, color='blue', alpha=.5)
+    ax.bar(x1-width/2., llr_b_hist[:len(x1)], width=width, color='red', alpha=.5)
+
+    ax.set_xlabel(r'$-2 \ln (Q)$',fontsize=14)
+    ax.set_ylabel('p.d.f.',fontsize=14)
+    ax.set_title('signal model ' + r'($m_\mathrm{H} = $'+str(spec['m_H'])+' GeV)')
+    ax.axvline(obs,label='observed',color='k')
+    ax.legend(fontsize=14)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def DrawHist2D (ax, spec) :
+
+    edges_x, edges_y = spec['edges']
+    mesh = ax.pcolormesh(edges_x, edges_y, spec['hist'].T)
+    ax.figure.colorbar(mesh, ax=ax)
+    ax.set_title(spec['title'],fontsize=fs+2)
+    ax.set_xlabel(spec['x_label'],fontsize=fs)
+    ax.set_ylabel(spec['y_label'],fontsize=fs)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def DrawCLsScan (ax, spec) :
+
+    masses = spec['masses']
+    ax.fill_between(masses, spec['CLs_twoSigma'][:,0], spec['CLs_twoSigma'][:,1], facecolor='yellow', label=r'expected $\pm 2\sigma$')
+    ax.fill_between(masses, spec['CLs_oneSigma'][:,0], spec['CLs_oneSigma'][:,1], facecolor='lawngreen', label=r'expected $\pm 1\sigma$')
+    ax.plot(masses, spec['CLs_median'], 'b--', label='expected bkg', linewidth=3)
+    ax.plot(masses, spec['CLs_obs'], 'r-', label='observed', linewidth=3)
+    ax.hlines(0.05, masses.min(), masses.max(), color='k', linewidth=1)
+    ax.text(masses.max(), 0.05, '95% CL', fontsize=14)
+
+    ax.set_yscale('log')
+    ax.set_xlim(masses.min(), masses.max())
+    ax.set_xlabel(r'$m_{H}$ [GeV]', fontsize=14)
+    ax.set_ylabel(r'CL${}_\mathrm{s}$', fontsize=14)
+    ax.legend(fontsize=14, loc='best')
+#-------------------------------------------------------------------------------------------
+
+
+DRAW = {'stack': (DrawStack, (8,10/3.)),
+        'llr': (DrawLogLikRatio, (8,10/3.)),
+        'hist2d': (DrawHist2D, (6.4,4.8)),
+        'cls_scan': (DrawCLsScan, (9,6))}
+
+
+#-------------------------------------------------------------------------------------------
+def SpecHash (spec, fmt='png', dpi=100) :
+
+    sha = hashlib.sha1(repr((RENDER_VERSION, fmt, dpi)).encode())
+    def Update (value) :
+        if isinstance(value, dict) :
+            for key in sorted(value) :
+                sha.update(repr(key).encode())
+                Update(value[key])
+        elif isinstance(value, (list, tuple)) :
+            sha.update(b'(')
+            for item in value :
+                Update(item)
+            sha.update(b')')
+        elif isinstance(value, np.ndarray) :
+            sha.update(repr((value.dtype.str, value.shape)).encode())
+            sha.update(np.ascontiguousarray(value).tobytes())
+        else :
+            sha.update(repr(value).encode())
+    Update(spec)
+    return sha.hexdigest()
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def RenderFigure (task) :
+    # draw one spec on its own Agg figure, no pyplot involved
+    spec, path, dpi = task
+    draw, figsize = DRAW[spec['kind']]
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    draw(ax, spec)
+    fig.tight_layout()
+    fig.savefig(path, dpi=dpi)
+    return path
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def RenderFigures (specs, target_dir, processes=None, fmt='png', dpi=100, force=False, progress=None) :
+    # render all specs whose hash changed (or whose file is missing) into target_dir
+    if not os.path.isdir(target_dir) :
+        os.makedirs(target_dir)
+    manifest_path = os.path.join(target_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path) :
+        with open(manifest_path) as f :
+            manifest = json.load(f)
+
+    tasks = []
+    hashes = {}
+    skipped = []
+    for spec in specs :
+        path = os.path.join(target_dir, spec['name']+'.'+fmt)
+        hashes[spec['name']] = SpecHash(spec, fmt, dpi)
+        if not force and manifest.get(spec['name']) == hashes[spec['name']] and os.path.exists(path) :
+            skipped.append(path)
+        else :
+            tasks.append((spec, path, dpi))
+
+    rendered = []
+    for (spec, path, dpi), result in zip(tasks, parallel.MapTasks(RenderFigure, tasks, processes, progress)) :
+        rendered.append(result)
+        manifest[spec['name']] = hashes[spec['name']]
+
+        # written after every figure, an interrupted batch keeps what is done
+        with open(manifest_path, 'w') as f :
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return {'rendered': rendered, 'skipped': skipped}
+#-------------------------------------------------------------------------------------------
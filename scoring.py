@@ -0,0 +1,109 @@
+import numpy as np
+import hashlib
+import json
+import cPickle
+import eventstore as es
+import parallel
+
+"""
+Batched, cached classifier scoring.
+Every sample is fed in fixed-size chunks through all classifiers at once (optionally on a process
+pool) and the score columns are stored next to the event data in the eventstore cache. Each column
+is keyed by a hash of the pickled model, the feature list and the source file, so unchanged scores
+are never recomputed, also not after a kernel restart.
+
+    classifiers = {'BDT_selCut85': 'BDT_85higgs1.pkl',
+                   'BDT_selCut90': 'BDT_90higgs4.pkl',
+                   'BDT_selCut95': 'BDT_95higgs3.pkl'}
+    qq = sc.ScoreSample('data/higgs_qq.csv', classifiers).to_frame()
+"""
+
+# the discriminating variables of PickDiscVar_mH85
+FEATURES = [u'btag1', u'btag2',
+       u'ucsdbt0', u'mvis', u'mvissc', u'fmvis', u'fmmis', u'fth1',
+       u'mmis', u'acthm', u'maxcthj', u'acop', u'maxxov', u'enj1',
+       u'thj1', u'phj1', u'xmj1', u'enj2', u'thj2', u'phj2', u'xmj2',
+       u'pho_num', u'pho_ene', u'pho_the', u'pho_phi', u'ele_num', u'ele_ene',
+       u'ele_the', u'ele_phi', u'muon_num', u'muon_ene', u'muon_the',
+       u'muon_phi']
+
+# models already unpickled in this process
+LOADED_MODELS = {}
+
+
+#-------------------------------------------------------------------------------------------
+def FileHash (path) :
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f :
+        for block in iter(lambda: f.read(1 << 20), b'') :
+            sha.update(block)
+    return sha.hexdigest()
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ScoreKey (model_hash, meta, features) :
+    # pickled model + feature list + source file (size and mtime)
+    key = {'model': model_hash,
+           'features': list(features),
+           'source': meta.get('source'),
+           'N_events': meta['N_events']}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LoadModel (model_path, model_hash=None) :
+    # keyed by the file hash as well, a re-trained model under the same name is loaded again
+    if model_hash is None :
+        model_hash = FileHash(model_path)
+    if (model_path, model_hash) not in LOADED_MODELS :
+        with open(model_path, 'rb') as fid :
+            LOADED_MODELS[(model_path, model_hash)] = cPickle.load(fid)
+    return LOADED_MODELS[(model_path, model_hash)]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ScoreChunk (task) :
+    # all classifiers on events start..stop of one cached sample
+    directory, models, features, start, stop = task
+    sample = es.LazySample(directory)
+    X = np.column_stack([np.asarray(sample[f][start:stop], dtype=float) for f in features])
+    return [LoadModel(path, model_hash).decision_function(X) for path, model_hash in models]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ScoreSample (csv_path, classifiers, features=FEATURES, chunk_size=100000, processes=1,
+                 cache_dir=None, progress=None) :
+    # classifiers: dict score column -> pickled model; returns the eventstore.LazySample
+    sample = es.OpenSample(csv_path, cache_dir=cache_dir)
+    directory = sample.directory
+    scores = dict(sample.meta.get('scores', {}))
+
+    missing = []
+    keys = {}
+    hashes = {}
+    for column in sorted(classifiers) :
+        hashes[column] = FileHash(classifiers[column])
+        keys[column] = ScoreKey(hashes[column], sample.meta, features)
+        if column not in sample or scores.get(column) != keys[column] :
+            missing.append(column)
+    if len(missing) == 0 :
+        return sample
+
+    models = [(classifiers[column], hashes[column]) for column in missing]
+    tasks = [(directory, models, features, start, min(start+chunk_size, len(sample)))
+             for start in xrange(0, len(sample), chunk_size)]
+
+    chunks = list(parallel.MapTasks(ScoreChunk, tasks, processes, progress))
+    columns = {}
+    for k,column in enumerate(missing) :
+        columns[column] = np.concatenate([chunk[k] for chunk in chunks]+[np.zeros(0)])
+        scores[column] = keys[column]
+
+    es.AddColumns(directory, columns, meta_extra={'scores': scores})
+    return es.LazySample(directory)
+#-------------------------------------------------------------------------------------------
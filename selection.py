@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import operator
+
+"""
+Declarative selection cuts with cached event masks.
+A cut is a hashable tuple
+    ('mmis', '>', 65)                                          single comparison
+    ('or', ('btag1', '>', 0.18), ('btag2', '>', 0.18))         any of the sub-cuts
+    ('and', cut1, cut2, ...)                                   all of the sub-cuts
+Masks are cached per (sample, cut), so a cut whose value does not change between mass
+hypotheses (btag, mmis, ...) is evaluated only once per sample, and selections are AND-ed
+boolean arrays instead of copied DataFrames. Samples can be DataFrames or eventstore.LazySample.
+
+    cache = {}
+    cuts = sel.SelectionCuts(mH_hypo=90)
+    mask = sel.SelectionMask(qq, cuts, cache, name='qq')
+    sel.CutFlow(qq, cuts, cache, name='qq')
+
+Without a name the sample is identified by id(sample), which is only unique while the sample is
+alive; give a name when the cache outlives the samples. Cached masks are read-only, copy them
+before changing them in place.
+"""
+
+OPERATORS = {'>': operator.gt,
+             '>=': operator.ge,
+             '<': operator.lt,
+             '<=': operator.le,
+             '==': operator.eq,
+             '!=': operator.ne}
+
+
+#-------------------------------------------------------------------------------------------
+def SelectionCuts (mH_hypo=85, bvalue=0.18) :
+    # the cuts of SelectionCut in the 2D notebook, as (label, cut) pairs
+    return [('btag', ('or', ('btag1', '>', bvalue), ('btag2', '>', bvalue))),
+            ('mmis', ('mmis', '>', 65)),
+            ('mvis', ('mvis', '<', mH_hypo+5)),
+            ('fmvis', ('fmvis', '<', mH_hypo+5)),
+            ('mvissc', ('mvissc', '<', mH_hypo+5)),
+            ('ucsdbt0', ('ucsdbt0', '>', 1.4))]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def BDTCut (mH_hypo, cut) :
+    # selection on the classifier score column, e.g. BDTCut(85, -3.15)
+    return [('BDT_selCut%i' %mH_hypo, ('BDT_selCut%i' %mH_hypo, '>', cut))]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SampleKey (sample, name=None) :
+    # the number of events guards against a name reused for another sample
+    return (name if name is not None else id(sample), len(sample))
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CutMask (sample, cut, cache=None, name=None) :
+
+    key = (SampleKey(sample, name), cut)
+    if cache is not None and key in cache :
+        return cache[key]
+
+    if cut[0] == 'or' :
+        mask = CutMask(sample, cut[1], cache, name).copy()
+        for subcut in cut[2:] :
+            mask |= CutMask(sample, subcut, cache, name)
+    elif cut[0] == 'and' :
+        mask = np.ones(len(sample), dtype=bool)
+        for subcut in cut[1:] :
+            mask &= CutMask(sample, subcut, cache, name)
+    else :
+        column, op, value = cut
+        if op not in OPERATORS :
+            raise ValueError("Unknown operator %s in cut %s." %(op, str(cut)))
+        mask = OPERATORS[op](np.asarray(sample[column]), value)
+
+    if cache is not None :
+        # shared by every later selection, an in-place change would corrupt the cache
+        mask.flags.writeable = False
+        cache[key] = mask
+    return mask
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SelectionMask (sample, cuts, cache=None, name=None) :
+    # cuts: list of (label, cut) pairs as returned by SelectionCuts
+    return CutMask(sample, ('and',)+tuple(cut for label, cut in cuts), cache, name)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CutFlow (sample, cuts, cache=None, name=None, weight='weight') :
+    # cumulative number of events and sum of weights after each (label, cut)
+    w = np.asarray(sample[weight], dtype=float) if weight in sample else np.ones(len(sample))
+
+    rows = [{'cut': 'all', 'events': len(w), 'weighted': w.sum()}]
+    applied = []
+    for label, cut in cuts :
+        applied.append(cut)
+        mask = CutMask(sample, ('and',)+tuple(applied), cache, name)
+        rows.append({'cut': label, 'events': np.count_nonzero(mask), 'weighted': w[mask].sum()})
+
+    flow = pd.DataFrame(rows, columns=['cut', 'events', 'weighted'])
+    total = flow['weighted'].iloc[0]
+    flow['efficiency'] = flow['weighted']/total if total > 0 else 0.
+    flow['relative'] = flow['weighted']/flow['weighted'].shift(1).fillna(total).replace(0, np.nan)
+    return flow
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CutFlowTable (samples, cuts, cache=None, weight='weight') :
+    # samples: dict name -> sample; weighted cut flow with one column per sample
+    table = {}
+    for name in samples :
+        table[name] = CutFlow(samples[name], cuts, cache, name, weight).set_index('cut')['weighted']
+    return pd.DataFrame(table, columns=list(samples))
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SelectedHistogram (sample, column, binning, mask, weight='weight') :
+    # histogram of the selected events, only the needed columns are indexed
+    values = np.asarray(sample[column])[mask]
+    weights = np.asarray(sample[weight])[mask] if weight in sample else None
+    return np.histogram(values, bins=binning, weights=weights)[0]
+#-------------------------------------------------------------------------------------------
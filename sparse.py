@@ -0,0 +1,157 @@
+import numpy as np
+import stats_2D as stat2D
+import cutscan
+
+"""
+Sparse N-dimensional histograms and templates for binnings where almost all cells are empty,
+e.g. mmis x composed x btag1 x acop. A sparse histogram only stores the flat ids of its occupied
+cells and their contents,
+    {'shape': (n1, n2, ...), 'ids': sorted flat cell ids, 'values': contents}
+and is filled directly from the event columns, so no dense grid is ever allocated.
+
+SparseTemplate returns the same dict as stats_2D.LogLikRatioTemplate, with the populated and
+signal-only cells. Toys are drawn over these cells only, so memory and time scale with the
+occupied cells, not with the grid size.
+
+    binning = [np.linspace(50,130,28), np.linspace(-14,8,23), np.linspace(0,1,11), np.linspace(0,3.2,17)]
+    columns = ['mmis', 'composed_85', 'btag1', 'acop']
+    b = sp.SparseHistogram([bkg[c] for c in columns], binning, bkg['weight'])
+    ...
+    llr_b, llr_sPlusb = sp.LogLikRatio_Sparse(b, s, N_experiments=10000)
+    llr_obs = sp.LogLikRatiosObserved_Sparse([b], [s], [N])
+    pl2.TwoDHist(..., sp.Projection(b, (0,1)), ...)
+"""
+
+#-------------------------------------------------------------------------------------------
+def SparseHistogram (values, binning, weights=None) :
+    # values: one coordinate array per dimension, binning: one array of edges per dimension
+    shape = tuple(len(edges)-1 for edges in binning)
+    index = [cutscan.BinIndex(np.asarray(v, dtype=float), edges) for v,edges in zip(values, binning)]
+    inside = np.all([i >= 0 for i in index], axis=0)
+
+    ids = np.ravel_multi_index([i[inside] for i in index], shape)
+    ids, inverse = np.unique(ids, return_inverse=True)
+    if weights is not None :
+        weights = np.asarray(weights, dtype=float)[inside]
+    contents = np.bincount(inverse, weights=weights, minlength=len(ids)).astype(float)
+
+    return {'shape': shape,
+            'ids': ids,
+            'values': contents}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ToSparse (hist) :
+    # dense array -> sparse histogram, sparse histograms are returned unchanged
+    if isinstance(hist, dict) :
+        return hist
+    hist = np.asarray(hist, dtype=float)
+    ids = np.flatnonzero(hist)
+    return {'shape': hist.shape,
+            'ids': ids,
+            'values': hist.ravel()[ids]}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Lookup (hist, ids) :
+    # contents of the cells ids, 0 for cells not stored
+    if len(hist['ids']) == 0 :
+        return np.zeros(len(ids))
+    pos = np.minimum(np.searchsorted(hist['ids'], ids), len(hist['ids'])-1)
+    return np.where(hist['ids'][pos] == ids, hist['values'][pos], 0.)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Dense (hist) :
+
+    dense = np.zeros(int(np.prod(hist['shape'])))
+    dense[hist['ids']] = hist['values']
+    return dense.reshape(hist['shape'])
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def Projection (hist, axes) :
+    # dense sum over all other axes, e.g. for the 1D and 2D plotting functions
+    axes = tuple(axes)
+    coordinates = np.unravel_index(hist['ids'], hist['shape'])
+    shape = tuple(hist['shape'][a] for a in axes)
+    ids = np.ravel_multi_index([coordinates[a] for a in axes], shape)
+    return np.bincount(ids, weights=hist['values'], minlength=int(np.prod(shape))).reshape(shape)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SparseTemplate (background, signal) :
+    # same keys as stats_2D.LogLikRatioTemplate, populated/sigOnly are flat cell ids
+    b = ToSparse(background)
+    s = ToSparse(signal)
+    if tuple(b['shape']) != tuple(s['shape']) :
+        raise ValueError("Background %s and signal %s have different shapes." %(b['shape'], s['shape']))
+
+    ids = np.union1d(b['ids'], s['ids'])
+    b_cells = Lookup(b, ids)
+    s_cells = Lookup(s, ids)
+    populated = b_cells > 0
+    sigOnly = (b_cells == 0) & (s_cells != 0)
+
+    N_bins = int(np.prod(b['shape']))
+    return {'shape': tuple(b['shape']),
+            'populated': ids[populated],
+            'sigOnly': ids[sigOnly],
+            'b': b_cells[populated],
+            's': s_cells[populated],
+            's_sigOnly': s_cells[sigOnly],
+            'weights': np.log(1+s_cells[populated]/b_cells[populated]),
+            's_tot': s['values'].sum(),
+            'N_bins': N_bins,
+            'N_emptyBins': N_bins - np.count_nonzero(populated) - np.count_nonzero(sigOnly)}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SparseCounts (template, data) :
+    # sparse or dense data -> (1, N_populated) and (1, N_sigOnly) counts, as stats_2D.SplitCounts
+    data = ToSparse(data)
+    return Lookup(data, template['populated'])[np.newaxis], Lookup(data, template['sigOnly'])[np.newaxis]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatio_Sparse (background, signal, N_experiments=10000, chunk_size=100000, random_state=None, emptyCalc=False,
+                        return_counts=False) :
+    # emptyCalc and return_counts as in stats_2D.LogLikRatio
+    template = SparseTemplate(background, signal)
+    llr_b_like, llr_sPlusb_like, counts = stat2D.LogLikRatioFromTemplate(template, N_experiments, chunk_size, random_state)
+    if emptyCalc == True:
+        stat2D.PrintCounts(counts)
+    if return_counts == True:
+        return llr_b_like, llr_sPlusb_like, counts
+    return llr_b_like, llr_sPlusb_like
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatiosObserved_Sparse (backgrounds, signals, datas, emptyCalc=False, return_counts=False) :
+
+    llr_data_is_b_like = []
+    counts = {'N_bins': 0, 'N_emptyBins': 0, 'N_divByZero': 0}
+    for l,s in enumerate(signals) :
+        template = SparseTemplate(backgrounds[l], s)
+        N, N_sigOnly = SparseCounts(template, datas[l])
+        llr, N_divByZero = stat2D.LogLikRatioKernel(template, N, N_sigOnly)
+        llr_data_is_b_like.append(llr[0])
+
+        counts['N_bins'] += template['N_bins']
+        counts['N_emptyBins'] += template['N_emptyBins']
+        counts['N_divByZero'] += N_divByZero
+
+    if emptyCalc == True:
+        stat2D.PrintCounts(counts)
+    if return_counts == True:
+        return llr_data_is_b_like, counts
+    return llr_data_is_b_like
+#-------------------------------------------------------------------------------------------
@@ -1,25 +1,60 @@
 import numpy as np
+from scipy.stats import norm
 
 
 #-------------------------------------------------------------------------------------------
-def LogLikRatio (background, signal, N_experiments=10000) :
-    
-           
-    b = background
-    s = signal
+def ChunkSizes (N_experiments, chunk_size=100000) :
+    # split N_experiments toys into blocks of at most chunk_size toys
+    chunk_size = int(max(1, chunk_size))
+    N_done = 0
+    while N_done < N_experiments :
+        n = min(chunk_size, N_experiments - N_done)
+        N_done += n
+        yield n
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def GetRandomState (random_state=None) :
+    # None -> global numpy state (as before), int/array -> new seeded RandomState
+    if random_state is None :
+        return np.random
+    if random_state is np.random or isinstance(random_state, np.random.RandomState) :
+        return random_state
+    return np.random.RandomState(random_state)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def IterLogLikRatio (background, signal, N_experiments=10000, chunk_size=100000, random_state=None) :
+    # yields (llr_b_like, llr_sPlusb_like) arrays of at most chunk_size toys each,
+    # so that the memory stays bounded by chunk_size*len(background)
+    random_state = GetRandomState(random_state)
+
+    b = np.asarray(background, dtype=float)
+    s = np.asarray(signal, dtype=float)
     s_tot = s.sum()
+    weights = np.log(1+s/b)
+
+    for n in ChunkSizes(N_experiments, chunk_size) :
+        N_b = random_state.poisson(lam=b, size=(n,)+b.shape)
+        N_sPlusb = random_state.poisson(lam=(s+b), size=(n,)+b.shape)
+
+        yield 2*s_tot - 2*np.dot(N_b,weights), 2*s_tot - 2*np.dot(N_sPlusb,weights)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatio (background, signal, N_experiments=10000, chunk_size=100000, random_state=None) :
     
     llr_b_like = []
     llr_sPlusb_like = []
 
-    for k in xrange(N_experiments) :
-        N_b = np.random.poisson(lam=b)
-        N_sPlusb = np.random.poisson(lam=(s+b))
+    for b_like, sPlusb_like in IterLogLikRatio(background, signal, N_experiments, chunk_size, random_state) :
+        llr_b_like.append(b_like)
+        llr_sPlusb_like.append(sPlusb_like)
 
-        llr_b_like.append(2*s_tot - 2*np.dot(N_b,np.log(1+s/b)))
-        llr_sPlusb_like.append(2*s_tot - 2*np.dot(N_sPlusb,np.log(1+s/b)))
-    
-    return llr_b_like, llr_sPlusb_like
+    return np.concatenate(llr_b_like+[[]]), np.concatenate(llr_sPlusb_like+[[]])
 #-------------------------------------------------------------------------------------------
 
 
@@ -60,4 +95,158 @@ def GetQuantiles (hist,binning) :
     
         
     return [Median,[OneSigmaLeft,OneSigmaRight],[TwoSigmaLeft,TwoSigmaRight]]
-#-------------------------------------------------------------------------------------------
\ No newline at end of file
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LLRDistribution (entry, min_prob=1e-12) :
+    # (llr_b, llr_sPlusb) toy arrays or an analytic.LogLikRatioAnalytic distribution ->
+    # llr values and normalized weights [(llr_b, w_b), (llr_sPlusb, w_sPlusb)]
+    if isinstance(entry, dict) :
+        keep = (entry['pdf_b'] > min_prob) | (entry['pdf_sPlusb'] > min_prob)
+        llr = entry['llr'][keep]
+        return [(llr, entry['pdf_b'][keep]), (llr, entry['pdf_sPlusb'][keep])]
+
+    llr_b, llr_sPlusb = entry
+    llr_b = np.asarray(llr_b, dtype=float)
+    llr_sPlusb = np.asarray(llr_sPlusb, dtype=float)
+    return [(llr_b, np.ones(len(llr_b))/len(llr_b)), (llr_sPlusb, np.ones(len(llr_sPlusb))/len(llr_sPlusb))]
+#-------------------------------------------------------------------------------------------
+
+
+"""
+Histogram-free CL and quantiles. Every toy array is sorted once, all observed values are then
+looked up with one vectorized searchsorted. The conventions are the ones of LogLikRatioPlots:
+    1-CL_b  = P_b   (-2lnQ <  obs)
+    CL_s+b  = P_s+b (-2lnQ >= obs)
+    CL_s    = CL_s+b / CL_b
+"""
+
+#-------------------------------------------------------------------------------------------
+def SortDistribution (values, weights=None) :
+    # -> sorted values and cumulative probabilities with a leading 0 (equal weights for toys)
+    values = np.asarray(values, dtype=float)
+    if weights is None :
+        return np.sort(values), np.arange(len(values)+1)/float(len(values))
+    order = np.argsort(values, kind='mergesort')
+    return values[order], np.concatenate([[0.], np.cumsum(weights[order])])
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SortedLLR (entry) :
+    # toy pair or analytic distribution -> [(sorted_b, cumulative_b), (sorted_sPlusb, cumulative_sPlusb)]
+    if isinstance(entry, dict) :
+        return [SortDistribution(entry['llr'], entry['pdf_b']), SortDistribution(entry['llr'], entry['pdf_sPlusb'])]
+    llr_b, llr_sPlusb = entry
+    return [SortDistribution(llr_b), SortDistribution(llr_sPlusb)]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CLFromSorted (sorted_llr, obs) :
+    
+    (values_b, cumulative_b), (values_sPlusb, cumulative_sPlusb) = sorted_llr
+    OneMinusCLb = cumulative_b[np.searchsorted(values_b, obs, side='left')]
+    CLsPlusb = 1. - cumulative_sPlusb[np.searchsorted(values_sPlusb, obs, side='left')]
+    
+    with np.errstate(divide='ignore', invalid='ignore') :
+        CLs = CLsPlusb/(1.-OneMinusCLb)
+
+    return OneMinusCLb, CLsPlusb, CLs
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def QuantilesFromSorted (values, cumulative) :
+    # same format as GetQuantiles
+    probs = [0.5, 0.16, 1.-0.16, 0.023, 1.-0.023]
+    pos = np.minimum(np.searchsorted(cumulative[1:], probs, side='left'), len(values)-1)
+    Median, OneSigmaLeft, OneSigmaRight, TwoSigmaLeft, TwoSigmaRight = values[pos]
+
+    return [Median,[OneSigmaLeft,OneSigmaRight],[TwoSigmaLeft,TwoSigmaRight]]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def GetCL (entry, obs) :
+    # obs may be a single value or an array of observed values
+    return CLFromSorted(SortedLLR(entry), obs)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def GetCLList (arrays, obs) :
+    # one entry (toy pair or analytic distribution) and observed value per hypothesis
+    # returns the same CLlist, QuantileList_b, QuantileList_sPlusb as LogLikRatioPlots
+    CLlist = []
+    QuantileList_b = []
+    QuantileList_sPlusb = []
+    
+    for i,entry in enumerate(arrays) :
+        sorted_llr = SortedLLR(entry)
+        OneMinusCLb, CLsPlusb, CLs = CLFromSorted(sorted_llr, obs[i])
+        CLlist.append([OneMinusCLb, CLsPlusb])
+        QuantileList_b.append(QuantilesFromSorted(*sorted_llr[0]))
+        QuantileList_sPlusb.append(QuantilesFromSorted(*sorted_llr[1]))
+        
+    return CLlist, QuantileList_b, QuantileList_sPlusb
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ExpectedBands (entry, pseudo=None) :
+    # distribution of the expected 1-CL_b for s+b pseudo-data and CL_s for b-only pseudo-data;
+    # the pseudo-observations default to the toys (or analytic distribution) of entry itself
+    sorted_llr = SortedLLR(entry)
+    if pseudo is None :
+        pseudo = entry
+    (pseudo_b, w_b), (pseudo_sPlusb, w_sPlusb) = LLRDistribution(pseudo)
+    if not isinstance(pseudo, dict) :
+        w_b = w_sPlusb = None
+
+    OneMinusCLb = CLFromSorted(sorted_llr, pseudo_sPlusb)[0]
+    CLs = CLFromSorted(sorted_llr, pseudo_b)[2]
+    OneMinusCLb_bands = QuantilesFromSorted(*SortDistribution(OneMinusCLb, w_sPlusb))
+    CLs_bands = QuantilesFromSorted(*SortDistribution(CLs, w_b))
+
+    return {'OneMinusCLb': OneMinusCLb,
+            'CLs': CLs,
+            'OneMinusCLb_bands': OneMinusCLb_bands,
+            'CLs_bands': CLs_bands,
+            'Z_median': norm.isf(OneMinusCLb_bands[0])}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ExpectedBandsList (arrays, pseudos=None) :
+    # one ExpectedBands per hypothesis
+    if pseudos is None :
+        pseudos = [None]*len(arrays)
+    return [ExpectedBands(entry, pseudo) for entry, pseudo in zip(arrays, pseudos)]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def AsimovSensitivity (background, signal) :
+    # toy-free expected sensitivity from the Gaussian approximation of -2lnQ, works on
+    # (..., N_bins) stacks of templates; bins without background only enter via s_tot
+    b = np.asarray(background, dtype=float)
+    s = np.asarray(signal, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore') :
+        weights = np.where(b > 0, np.log(1+s/np.where(b > 0, b, 1.)), 0.)
+
+    s_tot = s.sum(axis=-1)
+    mean_b = 2*s_tot - 2*(b*weights).sum(axis=-1)
+    mean_sPlusb = 2*s_tot - 2*((s+b)*weights).sum(axis=-1)
+    sigma_sPlusb = 2*np.sqrt(((s+b)*weights**2).sum(axis=-1))
+
+    # median b-only observation: CL_b = 0.5
+    with np.errstate(divide='ignore', invalid='ignore') :
+        CLsPlusb = np.where(sigma_sPlusb > 0, norm.sf((mean_b-mean_sPlusb)/sigma_sPlusb), 1.)
+    Z = np.sqrt(np.maximum(2*((s+b)*weights - np.where(b > 0, s, 0.)).sum(axis=-1), 0.))
+
+    return {'CLs': CLsPlusb/0.5,
+            'CLsPlusb': CLsPlusb,
+            'Z': Z}
+#-------------------------------------------------------------------------------------------
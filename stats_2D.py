@@ -1,39 +1,155 @@
 import numpy as np
+import stats as stat
+
+"""
+All LLR functions below are thin wrappers around one N-D kernel. Bins are sorted once per
+hypothesis into
+    populated   b > 0            : contribute 2*s - 2*N*log(1+s/b)
+    signal-only b == 0, s != 0   : contribute 2*s, the log term would blow up due to division
+                                   by zero and is not included (counted as N_divByZero if N != 0)
+    empty       b == 0, s == 0   : contribute nothing (counted as N_emptyBins)
+(As in 1D, where the bins just start at the first populated place, we ignore empty bins)
+"""
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioTemplate (background, signal) :
+    
+    b = np.asarray(background, dtype=float)
+    s = np.asarray(signal, dtype=float)
+    shape = b.shape
+    b = b.ravel()
+    s = s.ravel()
+
+    populated = np.flatnonzero(b > 0)
+    sigOnly = np.flatnonzero((b == 0) & (s != 0))
+
+    return {'shape': shape,
+            'populated': populated,
+            'sigOnly': sigOnly,
+            'b': b[populated],
+            's': s[populated],
+            's_sigOnly': s[sigOnly],
+            'weights': np.log(1+s[populated]/b[populated]),
+            's_tot': s.sum(),
+            'N_bins': b.size,
+            'N_emptyBins': b.size - len(populated) - len(sigOnly)}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioKernel (template, counts, counts_sigOnly=None) :
+    # counts: (N_toys, N_populated) bin contents of the populated bins
+    # counts_sigOnly: (N_toys, N_sigOnly) bin contents of the signal-only bins (optional)
+    llr = 2*template['s_tot'] - 2*np.dot(counts, template['weights'])
+    
+    N_divByZero = 0
+    if counts_sigOnly is not None :
+        N_divByZero = np.count_nonzero(counts_sigOnly)
+
+    return llr, N_divByZero
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SplitCounts (template, counts) :
+    # dense (N_toys,)+shape counts -> populated and signal-only columns
+    counts = np.asarray(counts)
+    counts = counts.reshape((-1, template['N_bins']))
+    return counts[:,template['populated']], counts[:,template['sigOnly']]
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioChunk (template, N_toys, random_state=None) :
+    # only populated and signal-only bins are drawn, empty bins are always 0
+    random_state = stat.GetRandomState(random_state)
+    b = template['b']
+    s = template['s']
+
+    N_b = random_state.poisson(lam=b, size=(N_toys, len(b)))
+
+    # one s+b draw over the populated and signal-only bins, the signal-only columns are only
+    # used to count N_divByZero (without signal-only bins this is the plain s+b draw)
+    lam_sPlusb = np.concatenate([s+b, template['s_sigOnly']])
+    N_sPlusb = random_state.poisson(lam=lam_sPlusb, size=(N_toys, len(lam_sPlusb)))
+
+    # a b-only toy never populates a bin without background
+    llr_b_like = LogLikRatioKernel(template, N_b)[0]
+    llr_sPlusb_like, N_divByZero = LogLikRatioKernel(template, N_sPlusb[:,:len(b)], N_sPlusb[:,len(b):])
+
+    return llr_b_like, llr_sPlusb_like, N_divByZero
+#-------------------------------------------------------------------------------------------
+
 
 #-------------------------------------------------------------------------------------------
-def LogLikRatio (background, signal, N_experiments=10000) :
+def LogLikRatio_ND (background, signal, N_experiments=10000, chunk_size=100000, random_state=None) :
     
-           
-    b = background
-    s = signal
-    s_tot = s.sum()
+    template = LogLikRatioTemplate(background, signal)
+    return LogLikRatioFromTemplate(template, N_experiments, chunk_size, random_state)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatioFromTemplate (template, N_experiments=10000, chunk_size=100000, random_state=None) :
+    # any template with the keys of LogLikRatioTemplate (e.g. sparse.SparseTemplate)
+    random_state = stat.GetRandomState(random_state)
     
     llr_b_like = []
     llr_sPlusb_like = []
+    N_divByZero = 0
 
-    N_emptyBins = 0
-
-    for k in xrange(N_experiments) :
-        N_b = np.random.poisson(lam=b)
-        N_sPlusb = np.random.poisson(lam=(s+b))
-
-        b_like, sPlusb_like = [0,0]
-        for i in xrange(len(b)) :
-            if b[i] == 0 :
-                if s[i] != 0 :
-                    b_like += 2*s[i]
-                    if N_b[i] != 0 :
-                        print "There was a bin with %f signal and %f data counts, but no background. As the ratio would blow up due to division by zero, we did not include it." %(s[i], N_b[i])
-                    if N_sPlusb[i] != 0:
-                        pass#b_like += -np.inf
-                else:
-                    N_emptyBins += 1
-            else:
-                b_like += 2*s[i] - 2*N_b[i]*np.log(1+s[i]/b[i])
-                sPlusb_like += 2*s[i] - 2*N_sPlusb[i]*np.log(1+s[i]/b[i])
+    for n in stat.ChunkSizes(N_experiments, chunk_size) :
+        b_like, sPlusb_like, divByZero = LogLikRatioChunk(template, n, random_state)
         llr_b_like.append(b_like)
         llr_sPlusb_like.append(sPlusb_like)
+        N_divByZero += divByZero
+
+    counts = {'N_bins': template['N_bins'],
+              'N_emptyBins': template['N_emptyBins'],
+              'N_divByZero': N_divByZero}
     
+    return np.concatenate(llr_b_like+[[]]), np.concatenate(llr_sPlusb_like+[[]]), counts
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatiosObserved_ND (backgrounds, signals, datas) :
+    # datas[l]: one histogram or a (N_toys,)+shape batch of pseudo-datasets
+    llr_data_is_b_like = []
+    counts = {'N_bins': 0, 'N_emptyBins': 0, 'N_divByZero': 0}
+    for l,s in enumerate(signals) :
+        template = LogLikRatioTemplate(backgrounds[l], s)
+        N, N_sigOnly = SplitCounts(template, datas[l])
+        llr, N_divByZero = LogLikRatioKernel(template, N, N_sigOnly)
+        # one value per data histogram, an array for a batch of pseudo-datasets
+        llr_data_is_b_like.append(llr[0] if len(llr) == 1 else llr)
+        
+        counts['N_bins'] += template['N_bins']
+        counts['N_emptyBins'] += template['N_emptyBins']
+        counts['N_divByZero'] += N_divByZero
+
+    return llr_data_is_b_like, counts
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def PrintCounts (counts) :
+    # what emptyCalc=True reports
+    print "%i out of %i bins where empty." %(counts['N_emptyBins'], counts['N_bins'])
+    if counts['N_divByZero'] != 0 :
+        print "%i signal-only bins had counts, as the ratio would blow up due to division by zero, we did not include them." %counts['N_divByZero']
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LogLikRatio (background, signal, N_experiments=10000, chunk_size=100000, random_state=None, emptyCalc=False,
+                 return_counts=False) :
+    # emptyCalc prints the bin counts, return_counts appends them to the result
+    llr_b_like, llr_sPlusb_like, counts = LogLikRatio_ND(background, signal, N_experiments, chunk_size, random_state)
+    if emptyCalc == True:
+        PrintCounts(counts)
+    if return_counts == True:
+        return llr_b_like, llr_sPlusb_like, counts
     return llr_b_like, llr_sPlusb_like
 #-------------------------------------------------------------------------------------------
 
@@ -42,26 +158,13 @@ def LogLikRatio (background, signal, N_experiments=10000) :
 """
 In case there are different backgrounds due to different cuts per signal hypothesis applied 
 """
-def LogLikRatiosObserved (backgrounds, signals, datas) :
-
-    N_emptyBins = 0
-    llr_data_is_b_like = [] 
-    for l,s in enumerate(signals) :       
-        b = backgrounds[l]
-        N = datas[l]
-        b_like = 0
-        for i in xrange(len(b)) :
-            if b[i] == 0 :
-                if s[i] != 0 :
-                    b_like += 2*s[i]
-                    if N[i] != 0 :
-                        print "There was a bin with %f signal and %f data counts, but no background. As the ratio would blow up due to division by zero, we did not include it." %(s[i], N[i])
-                        pass#b_like += -np.inf
-                else:
-                    N_emptyBins += 1
-            else:
-                b_like += 2*s[i] - 2*N[i]*np.log(1+s[i]/b[i])
-        llr_data_is_b_like.append(b_like)
+def LogLikRatiosObserved (backgrounds, signals, datas, emptyCalc=False, return_counts=False) :
+
+    llr_data_is_b_like, counts = LogLikRatiosObserved_ND(backgrounds, signals, datas)
+    if emptyCalc == True:
+        PrintCounts(counts)
+    if return_counts == True:
+        return llr_data_is_b_like, counts
     return llr_data_is_b_like
 #-------------------------------------------------------------------------------------------
 
@@ -70,72 +173,18 @@ def LogLikRatiosObserved (backgrounds, signals, datas) :
 """
 
 #-------------------------------------------------------------------------------------------
-def LogLikRatio_TwoD (background, signal, N_experiments=10000, emptyCalc = False) :
-    
-           
-    b = background
-    s = signal
-    
-    llr_b_like = []
-    llr_sPlusb_like = []
-
-    N_emptyBins = 0
+def LogLikRatio_TwoD (background, signal, N_experiments=10000, emptyCalc=False, chunk_size=100000, random_state=None,
+                      return_counts=False) :
 
-    for k in xrange(N_experiments) :
-        N_b = np.random.poisson(lam=b)
-        N_sPlusb = np.random.poisson(lam=(s+b))
-        
-        # Here, we have to take care of empty bins (can happen in the 2D case)
-        # (As in 1D, where the bins just start at the first populated place, we ignore empty bins)
-        b_like, sPlusb_like = [0,0]
-        for i in xrange(len(b)):
-            for j in xrange(len(b[0])):
-                if b[i,j] == 0:
-                    if s[i,j] != 0 :
-                        b_like += 2*s[i,j]
-                        if N_b[i,j] != 0 :
-                            print "There was a bin with %f signal and %f data counts, but no background. As the ratio would blow up due to division by zero, we did not include it." %(s[i,j], N_b[i,j])
-                        if N_sPlusb[i,j] != 0:
-                            pass#b_like += -np.inf
-                        else: N_emptyBins += 1
-                else:
-                        b_like += 2*s[i,j] - 2*N_b[i,j]*np.log(1+s[i,j]/b[i,j])
-                        sPlusb_like += 2*s[i,j] - 2*N_sPlusb[i,j]*np.log(1+s[i,j]/b[i,j])
-        llr_b_like.append(b_like)
-        llr_sPlusb_like.append(sPlusb_like)
-    if emptyCalc == True:
-        print "%i out of %i bins where empty." %(N_emptyBins, N_experiments*len(b)*len(b[0]))
-    return llr_b_like, llr_sPlusb_like
+    return LogLikRatio(background, signal, N_experiments, chunk_size, random_state, emptyCalc, return_counts)
 #-------------------------------------------------------------------------------------------
 
 
 
 #-------------------------------------------------------------------------------------------
-def LogLikRatioObserved_TwoD (bkgModels, signals, data_histModels, emptyCalc = False) :
+def LogLikRatioObserved_TwoD (bkgModels, signals, data_histModels, emptyCalc=False, return_counts=False) :
 
-    llr_data_is_b_like = []
-    N_emptyBins = 0
-    for k,s in enumerate(signals) :
-        b = bkgModels[k]
-        N = data_histModels[k]
-        # Here, we have to take care of empty bins (can happen in the 2D case)
-        # (As in 1D, where the bins just start at the first populated place, we ignore empty bins)
-        data_is_b_like = 0
-        for i in xrange(len(b)):
-            for j in xrange(len(b[0])):
-                if b[i,j] == 0:
-                    if s[i,j] != 0 :
-                        data_is_b_like += 2*s[i,j]
-                        if N[i,j] != 0 :
-                            print "There was a bin with %f signal and %f data counts, but no background. As the ratio would blow up due to division by zero, we did not include it." %(s[i,j], N[i,j])
-                        else: N_emptyBins += 1
-                else:
-                        data_is_b_like += 2*s[i,j] - 2*N[i,j]*np.log(1+s[i,j]/b[i,j])
-        llr_data_is_b_like.append(data_is_b_like)
-    if emptyCalc == True:
-        print "%i out of %i bins where empty." %(N_emptyBins, len(signals)*len(b)*len(b[0]))
-
-    return llr_data_is_b_like
+    return LogLikRatiosObserved(bkgModels, signals, data_histModels, emptyCalc, return_counts)
 #-------------------------------------------------------------------------------------------
 
 
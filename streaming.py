@@ -0,0 +1,162 @@
+import numpy as np
+import stats as stat
+import stats_2D as stat2D
+
+"""
+Constant-memory accumulators for toy -2ln(Q) values.
+An accumulator is a histogram on the global lattice [k*width, (k+1)*width) that grows to cover
+the filled range. Bins are aligned for a given width, so accumulators from separate chunks,
+workers or runs merge by adding counts. If a histogram would exceed max_bins the width is doubled
+(neighbouring bins are merged), so memory stays fixed and CLs/quantiles are exact up to one bin.
+"""
+
+#-------------------------------------------------------------------------------------------
+def NewAccumulator (bin_width=1e-3, max_bins=2**20) :
+
+    return {'width': float(bin_width),
+            'offset': 0,
+            'counts': np.zeros(0, dtype=np.int64),
+            'max_bins': int(max_bins),
+            'N': 0}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CoarsenAccumulator (acc) :
+    # double the bin width, bin k goes to bin k//2
+    counts = acc['counts']
+    if acc['offset'] % 2 != 0 :
+        counts = np.concatenate([[0], counts])
+        acc['offset'] -= 1
+    if len(counts) % 2 != 0 :
+        counts = np.concatenate([counts, [0]])
+    acc['counts'] = counts.reshape(-1,2).sum(axis=1)
+    acc['offset'] //= 2
+    acc['width'] *= 2
+    return acc
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ExtendAccumulator (acc, first, last) :
+    # make room for the lattice bins first..last (inclusive)
+    if len(acc['counts']) == 0 :
+        acc['offset'] = first
+        acc['counts'] = np.zeros(last-first+1, dtype=np.int64)
+        return acc
+
+    lower = min(first, acc['offset'])
+    upper = max(last, acc['offset']+len(acc['counts'])-1)
+    if lower < acc['offset'] or upper >= acc['offset']+len(acc['counts']) :
+        counts = np.zeros(upper-lower+1, dtype=np.int64)
+        counts[acc['offset']-lower:acc['offset']-lower+len(acc['counts'])] = acc['counts']
+        acc['offset'] = lower
+        acc['counts'] = counts
+    return acc
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def FillAccumulator (acc, values) :
+
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0 :
+        return acc
+
+    while True :
+        index = np.floor(values/acc['width']).astype(np.int64)
+        first, last = index.min(), index.max()
+        if len(acc['counts']) :
+            first = min(first, acc['offset'])
+            last = max(last, acc['offset']+len(acc['counts'])-1)
+        if last-first+1 <= acc['max_bins'] :
+            break
+        CoarsenAccumulator(acc)
+
+    ExtendAccumulator(acc, first, last)
+    acc['counts'] += np.bincount(index-acc['offset'], minlength=len(acc['counts']))
+    acc['N'] += len(values)
+    return acc
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def MergeAccumulators (accs) :
+    # accumulators must start from the same bin width (the coarsest one is used)
+    merged = NewAccumulator(max(acc['width'] for acc in accs), max(acc['max_bins'] for acc in accs))
+
+    for acc in accs :
+        ratio = merged['width']/acc['width']
+        if abs(np.log2(ratio) - np.rint(np.log2(ratio))) > 1e-9 :
+            raise ValueError("Accumulators with bin widths %g and %g cannot be merged." %(acc['width'], merged['width']))
+        acc = dict(acc)
+        while acc['width'] < merged['width']*(1-1e-9) :
+            CoarsenAccumulator(acc)
+        acc['width'] = merged['width']
+        if len(acc['counts']) == 0 :
+            continue
+
+        # coarsen both until they fit into max_bins together
+        while True :
+            lower = acc['offset']
+            upper = acc['offset']+len(acc['counts'])-1
+            if len(merged['counts']) :
+                lower = min(lower, merged['offset'])
+                upper = max(upper, merged['offset']+len(merged['counts'])-1)
+            if upper-lower+1 <= merged['max_bins'] :
+                break
+            CoarsenAccumulator(merged)
+            CoarsenAccumulator(acc)
+
+        ExtendAccumulator(merged, acc['offset'], acc['offset']+len(acc['counts'])-1)
+        start = acc['offset']-merged['offset']
+        merged['counts'][start:start+len(acc['counts'])] += acc['counts']
+        merged['N'] += acc['N']
+
+    return merged
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def AccumulatorDistribution (acc_b, acc_sPlusb) :
+    # -> distribution dict (bin centres) understood by stats.GetCL, stats.GetCLList and LogLikRatioPlots
+    width = max(acc_b['width'], acc_sPlusb['width'])
+    acc_b = MergeAccumulators([acc_b])
+    acc_sPlusb = MergeAccumulators([acc_sPlusb])
+    while acc_b['width'] < width :
+        CoarsenAccumulator(acc_b)
+    while acc_sPlusb['width'] < width :
+        CoarsenAccumulator(acc_sPlusb)
+
+    lower = min(acc_b['offset'], acc_sPlusb['offset'])
+    upper = max(acc_b['offset']+len(acc_b['counts']), acc_sPlusb['offset']+len(acc_sPlusb['counts']))
+
+    pdfs = []
+    for acc in [acc_b, acc_sPlusb] :
+        pdf = np.zeros(upper-lower)
+        pdf[acc['offset']-lower:acc['offset']-lower+len(acc['counts'])] = acc['counts']/float(max(acc['N'],1))
+        pdfs.append(pdf)
+
+    return {'llr': (np.arange(lower, upper)+0.5)*width,
+            'pdf_b': pdfs[0],
+            'pdf_sPlusb': pdfs[1],
+            'step': width}
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def AccumulateLogLikRatio (background, signal, N_experiments=10000, chunk_size=100000, random_state=None,
+                           bin_width=1e-3, max_bins=2**20) :
+    # toys go chunk by chunk into the accumulators, no toy array is kept
+    template = stat2D.LogLikRatioTemplate(background, signal)
+    random_state = stat.GetRandomState(random_state)
+
+    acc_b = NewAccumulator(bin_width, max_bins)
+    acc_sPlusb = NewAccumulator(bin_width, max_bins)
+    for n in stat.ChunkSizes(N_experiments, chunk_size) :
+        llr_b_like, llr_sPlusb_like = stat2D.LogLikRatioChunk(template, n, random_state)[:2]
+        FillAccumulator(acc_b, llr_b_like)
+        FillAccumulator(acc_sPlusb, llr_sPlusb_like)
+
+    return acc_b, acc_sPlusb
+#-------------------------------------------------------------------------------------------
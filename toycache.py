@@ -0,0 +1,134 @@
+import numpy as np
+import os
+import hashlib
+import parallel
+
+"""
+Content-addressed on-disk cache for toy -2ln(Q) results.
+The key is a hash of (background, signal, N_experiments, seed, chunk_size, bin_width and
+ALGORITHM_VERSION). Toys are generated with parallel.LogLikRatioPool, whose per-chunk seeding
+makes them independent of the number of processes, so a cached entry is exactly what a fresh
+run would give. Entries are compressed .npz files; above max_bytes the least recently used
+ones are evicted.
+
+    llr_85 = tc.CachedLogLikRatio(bkg_histos[0], sig_histos[0], N_experiments=10000, seed=85)
+    tc.CACHE_STATS
+"""
+
+# bump whenever the toy generation changes, old entries are then never hit again
+ALGORITHM_VERSION = 2
+
+CACHE_DIR = os.path.join('data', '.toycache')
+CACHE_STATS = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+#-------------------------------------------------------------------------------------------
+def ToyKey (background, signal, N_experiments, seed, chunk_size, bin_width=None) :
+
+    sha = hashlib.sha1()
+    for array in [background, signal] :
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        sha.update(str(array.shape).encode())
+        sha.update(array.tobytes())
+    sha.update(repr((int(N_experiments), seed, int(chunk_size), bin_width, ALGORITHM_VERSION)).encode())
+    return sha.hexdigest()
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def SaveEntry (path, result) :
+    # (llr_b, llr_sPlusb) arrays or (acc_b, acc_sPlusb) accumulators
+    arrays = {}
+    for name, entry in zip(['b', 'sPlusb'], result) :
+        if isinstance(entry, dict) :
+            for field in ['width', 'offset', 'counts', 'max_bins', 'N'] :
+                arrays[name+'_'+field] = np.asarray(entry[field])
+        else :
+            arrays[name] = np.asarray(entry)
+
+    # write to a temporary file first, a crashed run never leaves a broken entry behind
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f :
+        np.savez_compressed(f, **arrays)
+    if os.path.exists(path) :
+        os.remove(path)
+    os.rename(tmp, path)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def LoadEntry (path) :
+
+    with np.load(path) as f :
+        result = []
+        for name in ['b', 'sPlusb'] :
+            if name in f.files :
+                result.append(f[name])
+            else :
+                result.append({'width': float(f[name+'_width']),
+                               'offset': int(f[name+'_offset']),
+                               'counts': f[name+'_counts'],
+                               'max_bins': int(f[name+'_max_bins']),
+                               'N': int(f[name+'_N'])})
+    return tuple(result)
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def EvictCache (cache_dir=CACHE_DIR, max_bytes=2**30) :
+    # delete the least recently used entries (oldest mtime, refreshed on every hit)
+    if not os.path.isdir(cache_dir) :
+        return 0
+    entries = []
+    for filename in os.listdir(cache_dir) :
+        if filename.endswith('.npz') :
+            path = os.path.join(cache_dir, filename)
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+    entries.sort()
+
+    total = sum(size for mtime, size, path in entries)
+    N_evicted = 0
+    for mtime, size, path in entries :
+        if total <= max_bytes :
+            break
+        os.remove(path)
+        total -= size
+        N_evicted += 1
+    CACHE_STATS['evictions'] += N_evicted
+    return N_evicted
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def CachedLogLikRatio (background, signal, N_experiments=10000, seed=0, chunk_size=100000, bin_width=None,
+                       cache_dir=CACHE_DIR, max_bytes=2**30, processes=1) :
+    # same result as parallel.LogLikRatioPool([background], [signal], ...)[0]
+    key = ToyKey(background, signal, N_experiments, seed, chunk_size, bin_width)
+    path = os.path.join(cache_dir, key + '.npz')
+
+    if os.path.exists(path) :
+        CACHE_STATS['hits'] += 1
+        os.utime(path, None)
+        return LoadEntry(path)
+
+    CACHE_STATS['misses'] += 1
+    result = parallel.LogLikRatioPool([background], [signal], N_experiments, chunk_size, seed,
+                                      processes=processes, bin_width=bin_width)[0]
+    if not os.path.isdir(cache_dir) :
+        os.makedirs(cache_dir)
+    SaveEntry(path, result)
+    EvictCache(cache_dir, max_bytes)
+    return result
+#-------------------------------------------------------------------------------------------
+
+
+#-------------------------------------------------------------------------------------------
+def ClearCache (cache_dir=CACHE_DIR) :
+
+    if os.path.isdir(cache_dir) :
+        for filename in os.listdir(cache_dir) :
+            if filename.endswith('.npz') :
+                os.remove(os.path.join(cache_dir, filename))
+    for k in CACHE_STATS :
+        CACHE_STATS[k] = 0
+#-------------------------------------------------------------------------------------------